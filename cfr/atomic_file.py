@@ -0,0 +1,24 @@
+"""
+files replaced atomically: written next to their path and renamed over it, so that a crash leaves the previous file
+intact
+"""
+import os
+from contextlib import contextmanager
+
+
+@contextmanager
+def atomic_write(path):
+    """
+    binary file object to write the new content of path into, renamed over path when the block exits without error
+    """
+    tmp_path = path + ".tmp"
+    try:
+        with open(tmp_path, "wb") as f:
+            yield f
+            f.flush()
+            os.fsync(f.fileno())
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+    os.replace(tmp_path, path)
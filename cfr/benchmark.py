@@ -0,0 +1,206 @@
+"""
+benchmark of the solvers on the games of envs: iterations/s, nodes visited/s, peak memory and exploitability against
+training time, saved as JSON so that two commits can be compared
+
+    $ python benchmark.py --games kuhn leduc --seconds 10 --output before.json
+    $ python benchmark.py --games kuhn leduc --seconds 10 --output after.json
+    $ python benchmark.py --compare before.json after.json
+
+every benchmark runs in a fresh process, so that its peak memory is its own. The time spent on exploitability
+evaluation is not counted as training time.
+"""
+import argparse
+import json
+import multiprocessing
+import os
+import platform
+import resource
+import subprocess
+import sys
+import time
+
+import numpy as np
+
+import best_response
+import logger
+from cfr import TreeCFR
+from envs.toy_pokers import KuhnPoker, LeducHoldem, Poker
+from flat_tree import FlatTree, FlatCFR
+from mccfr import MCCFR_SOLVERS
+from parallel import ParallelCFR
+from pruning import Pruning, set_subtree_sizes
+from public_tree import PublicTree, PublicTreeCFR
+
+GAMES = {
+    "kuhn": KuhnPoker,
+    "leduc": LeducHoldem,
+    "leduc-13": lambda: Poker(num_ranks=13, num_suits=2, num_rounds=2, bet_sizes=((2,), (4,)), max_raises=2),
+}
+
+
+def _pruned_tree_cfr(game):
+    set_subtree_sizes(game.root)
+    return TreeCFR(game, alternating=True, pruning=Pruning(regret_based=True))
+
+
+SOLVERS = {
+    "cfr": lambda game: TreeCFR(game),
+    "cfr-alternating": lambda game: TreeCFR(game, alternating=True),
+    "cfr+": lambda game: TreeCFR(game, "cfr+", alternating=True),
+    "dcfr": lambda game: TreeCFR(game, "dcfr", alternating=True),
+    "cfr-pruning": _pruned_tree_cfr,
+    "flat": lambda game: FlatCFR(FlatTree(game.root, game.num_players)),
+    "flat-cfr+": lambda game: FlatCFR(FlatTree(game.root, game.num_players), "cfr+", alternating=True),
+    "public": lambda game: PublicTreeCFR(PublicTree(game.root, game.num_players)),
+    "public-cfr+": lambda game: PublicTreeCFR(PublicTree(game.root, game.num_players), "cfr+", alternating=True),
+    "parallel": lambda game: ParallelCFR(game, os.cpu_count()),
+    "mccfr-chance": lambda game: MCCFR_SOLVERS["chance"](game, seed=0),
+    "mccfr-external": lambda game: MCCFR_SOLVERS["external"](game, seed=0),
+    "mccfr-outcome": lambda game: MCCFR_SOLVERS["outcome"](game, seed=0),
+}
+
+
+def run_benchmark(game_name, solver_name, seconds, max_iterations=None, num_evaluations=8):
+    """
+    train for `seconds` of training time (or max_iterations), evaluating the exploitability at num_evaluations
+    log-spaced training times
+    """
+    start = time.perf_counter()
+    game = GAMES[game_name]()
+    build_seconds = time.perf_counter() - start
+    start = time.perf_counter()
+    solver = SOLVERS[solver_name](game)
+    setup_seconds = time.perf_counter() - start
+
+    eval_times = np.geomspace(seconds / 2 ** (num_evaluations - 1), seconds, num_evaluations).tolist()
+    train_seconds = 0.0
+    iterations = 0
+    nodes = 0
+    curve = []  # [{seconds, iterations, exploitability}]
+    try:
+        while train_seconds < seconds and (max_iterations is None or iterations < max_iterations):
+            start = time.perf_counter()
+            solver.iteration()
+            train_seconds += time.perf_counter() - start
+            iterations += 1
+            nodes += solver.num_visited
+            if eval_times and train_seconds >= eval_times[0]:
+                while eval_times and train_seconds >= eval_times[0]:
+                    eval_times.pop(0)
+                exploitability = best_response.get_exploitability(game, solver.average_strategy_profile())
+                curve.append({"seconds": train_seconds, "iterations": iterations, "exploitability": exploitability})
+        if not curve or curve[-1]["iterations"] != iterations:
+            exploitability = best_response.get_exploitability(game, solver.average_strategy_profile())
+            curve.append({"seconds": train_seconds, "iterations": iterations, "exploitability": exploitability})
+    finally:
+        if hasattr(solver, "close"):
+            solver.close()
+    return {
+        "game": game_name,
+        "solver": solver_name,
+        "build_seconds": build_seconds,
+        "setup_seconds": setup_seconds,
+        "train_seconds": train_seconds,
+        "iterations": iterations,
+        "iterations_per_second": iterations / train_seconds,
+        "nodes_per_second": nodes / train_seconds,
+        "peak_memory_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,  # KiB on Linux
+        "final_exploitability": curve[-1]["exploitability"],
+        "curve": curve,
+    }
+
+
+def _run_in_child(conn, *args):
+    logger.Logger.CURRENT = logger.Logger(dir=None, output_formats=[])  # the solvers' logkv calls are discarded
+    try:
+        conn.send(run_benchmark(*args))
+    except Exception as e:
+        conn.send({"error": repr(e)})
+
+
+def run_isolated(*args):
+    """
+    run_benchmark in a child process, so that its peak memory is its own
+    a child that dies without a result (e.g. killed when out of memory) is recorded as an error
+    """
+    conn, child_conn = multiprocessing.Pipe()
+    process = multiprocessing.Process(target=_run_in_child, args=(child_conn,) + args)
+    process.start()
+    child_conn.close()  # so that recv sees the end of the pipe when the child exits
+    try:
+        result = conn.recv()
+    except EOFError:
+        result = None
+    process.join()
+    conn.close()
+    if result is None:
+        result = {"error": "exit code %d" % process.exitcode}
+    return result
+
+
+def get_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "HEAD"], capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(old_path, new_path):
+    with open(old_path) as f:
+        old = json.load(f)
+    with open(new_path) as f:
+        new = json.load(f)
+    old_results = {(r["game"], r["solver"]): r for r in old["results"] if "error" not in r}
+    print("%-10s %-16s %14s %14s %12s %24s" % ("game", "solver", "iter/s", "nodes/s", "peak MB", "exploitability"))
+    for r in new["results"]:
+        o = old_results.get((r["game"], r["solver"]))
+        if o is None or "error" in r:
+            continue
+        print("%-10s %-16s %13.2fx %13.2fx %12s %24s" % (
+            r["game"], r["solver"], r["iterations_per_second"] / o["iterations_per_second"],
+            r["nodes_per_second"] / o["nodes_per_second"] if o["nodes_per_second"] else float("nan"),
+            "%.0f -> %.0f" % (o["peak_memory_mb"], r["peak_memory_mb"]),
+            "%.3g -> %.3g" % (o["final_exploitability"], r["final_exploitability"])))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="benchmark the solvers")
+    parser.add_argument("--games", nargs="+", default=["kuhn", "leduc"], choices=list(GAMES))
+    parser.add_argument("--solvers", nargs="+", default=list(SOLVERS), choices=list(SOLVERS))
+    parser.add_argument("--seconds", type=float, default=10, help="training time of each benchmark")
+    parser.add_argument("--max-iterations", type=int)
+    parser.add_argument("--output", default="benchmark.json")
+    parser.add_argument("--compare", nargs=2, metavar=("OLD", "NEW"), help="compare two outputs instead")
+    args = parser.parse_args()
+    if args.compare:
+        compare(*args.compare)
+        return
+
+    results = []
+    for game_name in args.games:
+        for solver_name in args.solvers:
+            result = run_isolated(game_name, solver_name, args.seconds, args.max_iterations)
+            result.setdefault("game", game_name)
+            result.setdefault("solver", solver_name)
+            results.append(result)
+            if "error" in result:
+                print("%-10s %-16s %s" % (game_name, solver_name, result["error"]))
+            else:
+                print("%-10s %-16s %10.1f iter/s %12.0f nodes/s %8.0f MB  exploitability %.4g" % (
+                    game_name, solver_name, result["iterations_per_second"], result["nodes_per_second"],
+                    result["peak_memory_mb"], result["final_exploitability"]))
+    with open(args.output, "w") as f:
+        json.dump({
+            "commit": get_commit(),
+            "time": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "python": sys.version.split()[0],
+            "numpy": np.__version__,
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count(),
+            "seconds": args.seconds,
+            "results": results,
+        }, f, indent=1)
+
+
+if __name__ == "__main__":
+    main()
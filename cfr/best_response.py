@@ -0,0 +1,102 @@
+from envs.game import Node
+
+
+def get_levels(root: Node):
+    """
+    nodes of the tree grouped by depth
+    with perfect recall, every node of an information set is on the same level
+    """
+    levels = []
+    level = [root]
+    while level:
+        levels.append(level)
+        level = [child for node in level if not node.terminal for child in node.children.values()]
+    return levels
+
+
+def get_p_dist(strategy_profile: dict, node: Node):
+    """
+    information sets missing from strategy_profile (e.g. never reached by a sampling solver on a lazy game) are uniform
+    """
+    p_dist = strategy_profile[node.player].get(node.information)
+    if p_dist is None:
+        p_dist = {action: 1 / len(node.children) for action in node.children}
+    return p_dist
+
+
+def get_opponent_reach(levels, strategy_profile: dict, num_players: int):
+    """
+    reach[player][node]: probability that chance and every player except `player` play to node
+    """
+    reach = {player: {levels[0][0]: 1.0} for player in range(num_players)}
+    for level in levels:
+        for node in level:
+            if node.terminal:
+                continue
+            p_dist = get_p_dist(strategy_profile, node)
+            for player in range(num_players):
+                node_reach = reach[player][node]
+                if player == node.player:
+                    for child in node.children.values():
+                        reach[player][child] = node_reach
+                else:
+                    for action, child in node.children.items():
+                        reach[player][child] = node_reach * p_dist[action]
+    return reach
+
+
+def compute_best_response(levels, strategy_profile: dict, opponent_reach: dict, br_player: int, chance_p_dist=None):
+    """
+    best response of br_player against strategy_profile in a single bottom-up pass
+    the value of each action is aggregated over the nodes of an information set weighted by the opponent reach,
+    so every node is evaluated exactly once
+    chance_p_dist(node): {action: p} of the chance nodes, uniform by default. Only the children of its actions need to
+                         be in levels (e.g. sampled chance outcomes).
+    returns (expected utility of br_player, best response policy {information: {action: p}})
+    """
+    sign = 1 if br_player == 0 else -1  # utilities are stored from player 0's point of view
+    value = {}
+    policy = {}
+    for level in reversed(levels):
+        action_values = {}
+        for node in level:
+            if node.terminal:
+                value[node] = sign * node.eu
+            elif node.player == br_player:
+                q = action_values.get(node.information)
+                if q is None:
+                    q = action_values[node.information] = {action: 0 for action in node.children}
+                node_reach = opponent_reach[node]
+                for action, child in node.children.items():
+                    q[action] += node_reach * value[child]
+            else:
+                if node.player == -1 and chance_p_dist is not None:
+                    p_dist = chance_p_dist(node)
+                else:
+                    p_dist = get_p_dist(strategy_profile, node)
+                value[node] = sum(p * value[node.children[action]] for action, p in p_dist.items())
+        best_actions = {}
+        for information, q in action_values.items():
+            best_actions[information] = max(q, key=q.get)
+            policy[information] = {action: 1.0 if action == best_actions[information] else 0.0 for action in q}
+        for node in level:
+            if not node.terminal and node.player == br_player:
+                value[node] = value[node.children[best_actions[node.information]]]
+    return value[levels[0][0]], policy
+
+
+def get_best_responses(game, strategy_profile: dict):
+    """
+    {player: (best response value, best response policy)} for every player
+    """
+    levels = get_levels(game.root)
+    opponent_reach = get_opponent_reach(levels, strategy_profile, game.num_players)
+    return {player: compute_best_response(levels, strategy_profile, opponent_reach[player], player)
+            for player in range(game.num_players)}
+
+
+def get_exploitability(game, strategy_profile: dict):
+    """
+    sum of the values each player gets by best responding to strategy_profile
+    """
+    return sum(value for value, _ in get_best_responses(game, strategy_profile).values())
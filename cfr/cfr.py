@@ -1,132 +1,187 @@
-from copy import copy
-from copy import deepcopy
+import argparse
 
-from tqdm import tqdm
 import yaml
 
+import numpy as np
+
+import best_response
 import logger
-from envs.toy_pokers import Node, KuhnPoker
-
-
-def update_pi(node: Node, strategy_profile: dict, average_strategy_profile: dict, pi_mi_list: list, pi_i_list: list, true_pi_mi_list: list):
-    node.pi = pi_mi_list[node.player] * pi_i_list[node.player]
-    node.true_pi_mi = true_pi_mi_list[node.player]
-    node.pi_mi = pi_mi_list[node.player]
-    node.pi_i = pi_i_list[node.player]
-
-    if node.terminal:
-        return
-    for action, child_node in node.children.items():
-        next_pi_mi_list = copy(pi_mi_list)
-        next_pi_i_list = copy(pi_i_list)
-        next_true_pi_mi_list = copy(true_pi_mi_list)
-        for player in strategy_profile.keys():
-            if player == node.player:
-                next_pi_i_list[player] *= strategy_profile[node.player][node.information][action]
-            else:
-                next_pi_mi_list[player] *= strategy_profile[node.player][node.information][action]
-                next_true_pi_mi_list[player] *= average_strategy_profile[node.player][node.information][action]
-        update_pi(child_node, strategy_profile, average_strategy_profile, next_pi_mi_list, next_pi_i_list, next_true_pi_mi_list)
-
-
-def update_node_values(node: Node, strategy_profile: dict):
-    node_eu = 0  # ノードに到達した後得られる期待利得
-    node.num_updates += 1
-    if node.terminal:
-        return node.eu
-    node.pi_i_sum += node.pi_i
-    for action, child_node in node.children.items():
-        p = strategy_profile[node.player][node.information][action]
-        node.pi_sigma_sum[action] += node.pi_i * p
-        node_eu += p * update_node_values(child_node, strategy_profile)
-    node.eu = node_eu
-    node.cv = node.pi_mi * node_eu
-    for action, child_node in node.children.items():
-        cfr = node.pi_mi * child_node.eu - node.cv if node.player == 0 else (-1) * (node.pi_mi * child_node.eu - node.cv)
-        node.cfr[action] += cfr
-    return node_eu
-
-
-def get_initial_strategy_profile(node: Node, num_players=None, strategy_profile=None):
-    if node.terminal:
-        return strategy_profile
-    if strategy_profile is None:
-        strategy_profile = {player: {} for player in range(-1, num_players)}  # chance nodeのために+1する
-    if node.information not in strategy_profile[node.player]:
-        strategy_profile[node.player][node.information] = {action: 1 / len(node.children) for action in node.children}
-    for child in node.children.values():
-        strategy_profile = get_initial_strategy_profile(child, strategy_profile=strategy_profile)
-    return strategy_profile
-
-
-def update_strategy(strategy_profile: dict, average_strategy_profile: dict, information_sets: dict):
-    for player, information_policy in strategy_profile.items():
-        if player == -1:
+import profiling
+from checkpoint import Checkpointer
+from envs.game import Node
+from envs.toy_pokers import KuhnPoker
+from evaluation import Evaluator, Modulo
+from flat_tree import FlatTree, FlatCFR
+from infoset_table import InfosetTable, TableSolver
+from mccfr import MCCFR_SOLVERS
+from parallel import ParallelCFR
+from policy_store import write_policy_store
+from pruning import set_subtree_sizes
+from public_tree import PublicTree, PublicTreeCFR
+from stopping import Plateau, Progress, ProgressReporter, TargetExploitability
+from update_rules import UpdateRule, get_update_rule
+
+
+def traverse_tree(root: Node, table: InfosetTable, traverser=None, pruning=None, root_reach=None):
+    """
+    the traversal of one CFR iteration: reach probabilities flow down, expected values and regrets flow back up,
+    and the regrets and own reach of every node are accumulated into the buffers of its information set in table
+    the path from the root lives in per-depth buffers that are reused, so nothing is allocated per node and the depth
+    of the tree is not limited by the recursion limit
+    traverser: only accumulate the traverser's nodes (alternating updates)
+    pruning: skip the subtrees selected by pruning.Pruning and mark them with node.pruned. They are only reached through
+             actions of probability 0. The children pruned by regret based pruning take pruning.optimistic as their
+             expected value.
+    root_reach: reach probabilities of root when it is not the root of the game, [player 0, ..., chance]
+    returns the number of nodes visited
+    """
+    num_players = table.num_players
+    strategy = table.strategy_rows
+    regret_delta, reach_delta = table.regret_delta, table.reach_delta
+    zero_reach = pruning is not None and pruning.zero_reach
+    prune_regrets = pruning is not None and pruning.prune_regrets
+    if prune_regrets:
+        pruned_slots, optimistic = pruning.pruned_slots, pruning.optimistic
+        cfv_sum, visited = pruning.cfv_sum, pruning.visited
+
+    path = [root]  # path[depth]: node being traversed at depth
+    next_slots = [0]  # next_slots[depth]: slot of the next child of path[depth] to traverse
+    node_eus = [0.0]  # node_eus[depth]: expected value of path[depth] accumulated over its traversed children
+    # reaches[depth][player]: reach of player, chance is the last one
+    reaches = [[1.0 for _ in range(num_players + 1)] if root_reach is None else list(root_reach)]
+    depth = 0
+    num_visited = 1
+    while depth >= 0:
+        node = path[depth]
+        slot = next_slots[depth]
+        if slot < len(node.child_nodes):  # go down to the next child
+            next_slots[depth] = slot + 1
+            child_node = node.child_nodes[slot]
+            p = strategy[node.info_id][slot]
+            num_visited += 1
+            if child_node.terminal:
+                node_eus[depth] += p * child_node.eu
+                continue
+            if depth + 1 == len(path):
+                path.append(None)
+                next_slots.append(0)
+                node_eus.append(0.0)
+                reaches.append([1.0 for _ in range(num_players + 1)])
+            reach = reaches[depth + 1]
+            reach[:] = reaches[depth]
+            reach[node.player] *= p
+            if pruning is not None:
+                if zero_reach:
+                    if traverser is None:
+                        unreached = not any(reach[player] for player in range(num_players))
+                    else:
+                        unreached = reach[traverser] == 0 and not all(reach[player] for player in range(-1, num_players) if player != traverser)
+                    if unreached:
+                        num_visited -= 1
+                        pruning.prune(child_node)
+                        continue
+                if prune_regrets and node.player == traverser and p == 0 and pruned_slots[node.info_id][slot]:
+                    num_visited -= 1
+                    pruning.prune(child_node)
+                    child_node.eu = optimistic[child_node]
+                    continue
+                child_node.pruned = False
+            depth += 1
+            path[depth] = child_node
+            next_slots[depth] = 0
+            node_eus[depth] = 0.0
             continue
-        for information, strategy in information_policy.items():
-            cfr = {}
-            for action in strategy.keys():
-                cfr_in_info = 0
-                average_strategy_denominator = 0
-                average_strategy_numerator = 0
-                for same_info_node in information_sets[player][information]:
-                    cfr_in_info += same_info_node.cfr[action]
-                    average_strategy_denominator += same_info_node.pi_i_sum
-                    average_strategy_numerator += same_info_node.pi_sigma_sum[action]
-                cfr[action] = max(cfr_in_info, 0)
-                average_strategy_profile[player][information][action] = average_strategy_numerator / average_strategy_denominator
-            cfr_sum = sum([cfr_values for cfr_values in cfr.values()])
-            for action in strategy.keys():
-                if cfr_sum > 0:
-                    strategy[action] = cfr[action] / cfr_sum
-                else:
-                    strategy[action] = 1 / len(strategy)
-    return
-
-
-def compute_exploitability(node, information_sets, average_strategy_profile, opponent_player):
+
+        node_eu = node_eus[depth]  # ノードに到達した後得られる期待利得
+        node.eu = node_eu
+        if node.player != -1 and (traverser is None or node.player == traverser):
+            reach = reaches[depth]
+            pi_mi = 1.0
+            for player in range(-1, num_players):
+                if player != node.player:
+                    pi_mi *= reach[player]
+            reach_delta[node.info_id] += reach[node.player]
+            cv = pi_mi * node_eu
+            regret = regret_delta[node.info_id]
+            if prune_regrets:
+                cfv_sum[node.info_id] += cv if node.player == 0 else -cv
+                visited[node.info_id] = True
+            for slot, child_node in enumerate(node.child_nodes):
+                regret[slot] += pi_mi * child_node.eu - cv if node.player == 0 else (-1) * (pi_mi * child_node.eu - cv)
+        depth -= 1
+        if depth >= 0:
+            parent = path[depth]
+            node_eus[depth] += strategy[parent.info_id][next_slots[depth] - 1] * node_eu
+    return num_visited
+
+
+def update_strategy(table: InfosetTable, t=1, update_rule=None, players=None):
     """
-    exploitability when opponent player chooses best response for current strategy
+    t: number of iterations done so far, used by the discounting of update_rule
+    players: only update the strategies of these players (alternating updates), all players by default
+    the average strategy is not touched, table.average_strategy_profile() computes it when it is needed
     """
-    if node.terminal:
-        return node.eu
-    if node.player == opponent_player:  # choose exploitable strategy
-        best_response_value = None
-        best_weighted_expected_utility = -float("inf") if opponent_player == 0 else float("inf")  # current best value
-        for action, _ in node.children.items():
-            current_weighted_expected_utility = 0  # current value of sum of reach_p * expected_utility
-            current_node_expected_utility = 0
-            for same_info_node in information_sets[node.player][node.information]:
-                expected_utility = compute_exploitability(same_info_node.children[action], information_sets, average_strategy_profile, opponent_player)
-                if node == same_info_node:
-                    current_node_expected_utility = expected_utility
-                current_weighted_expected_utility += same_info_node.true_pi_mi * expected_utility
-            if opponent_player == 0:
-                if best_weighted_expected_utility < current_weighted_expected_utility:
-                    best_weighted_expected_utility = current_weighted_expected_utility
-                    best_response_value = current_node_expected_utility
-            else:
-                if best_weighted_expected_utility > current_weighted_expected_utility:
-                    best_weighted_expected_utility = current_weighted_expected_utility
-                    best_response_value = current_node_expected_utility
-        return best_response_value
+    table.update(t, update_rule, players)
 
-    else:  # use current strategy
-        expected_utility = 0
-        for action, child_node in node.children.items():
-            p = average_strategy_profile[node.player][node.information][action]
-            expected_utility += p * compute_exploitability(child_node, information_sets, average_strategy_profile, opponent_player)
-    return expected_utility
 
+class TreeCFR(TableSolver):
+    """
+    CFR by traverse_tree on the Node tree, with the regrets and strategy sums of an InfosetTable
+    """
+    def __init__(self, game, update_rule=None, alternating=False, pruning=None):
+        self.game = game
+        self.table = InfosetTable.from_tree(game.root, game.num_players)
+        self.update_rule = update_rule
+        self.alternating = alternating
+        self.pruning = pruning
+        if pruning is not None and pruning.regret_based:
+            if not alternating or type(get_update_rule(update_rule)) is not UpdateRule:
+                raise ValueError("regret based pruning requires vanilla CFR with alternating updates")
+            pruning.setup(game.root, self.table)
+        self.t = 0  # number of iterations done
+        self.num_visited = 0  # nodes visited in the last iteration
+        self.num_updated = 0  # information sets updated in the last iteration
 
-def get_exploitability(game, average_strategy_profile):
-    exploitability = 0
-    for player in range(game.num_players):
-        if player == 0:
-            exploitability += compute_exploitability(game.root, game.information_sets, average_strategy_profile, player)
+    def iteration(self):
+        game, table, pruning = self.game, self.table, self.pruning
+        if pruning is not None:
+            pruning.begin_iteration()
+        self.t += 1
+        if self.alternating:
+            self.num_visited = self.num_updated = 0
+            for player in range(game.num_players):
+                with profiling.phase("traverse"):
+                    if pruning is not None:
+                        pruning.begin_traversal(player, table)
+                    self.num_visited += traverse_tree(game.root, table, player, pruning)
+                    if pruning is not None:
+                        pruning.end_traversal()
+                with profiling.phase("update"):
+                    update_strategy(table, self.t, self.update_rule, [player])
+                self.num_updated += len(table.rows([player]))
         else:
-            exploitability += (-1) * compute_exploitability(game.root, game.information_sets, average_strategy_profile, player)
-    return exploitability
+            with profiling.phase("traverse"):
+                self.num_visited = traverse_tree(game.root, table, pruning=pruning)
+            with profiling.phase("update"):
+                update_strategy(table, self.t, self.update_rule)
+            self.num_updated = len(table.rows())
+        if pruning is not None:
+            logger.logkv_mean("nodes_pruned", pruning.num_pruned)
+
+    def state_dict(self):
+        state = super().state_dict()
+        if self.pruning is not None and self.pruning.regret_based:
+            state.update(self.pruning.state_dict())
+        return state
+
+    def load_state_dict(self, state: dict):
+        super().load_state_dict(state)
+        if self.pruning is not None and self.pruning.regret_based:
+            self.pruning.load_state_dict(state)
+
+
+def get_exploitability(game, average_strategy_profile):
+    return best_response.get_exploitability(game, average_strategy_profile)
 
 
 def check_exploitability():
@@ -135,26 +190,142 @@ def check_exploitability():
     """
     game = KuhnPoker()
     nash_equilibrium = game.get_nash_equilibrium(game.root)
-    update_pi(game.root, nash_equilibrium, nash_equilibrium, [1.0 for _ in range(game.num_players + 1)],
-              [1.0 for _ in range(game.num_players + 1)], [1.0 for _ in range(game.num_players + 1)])
     exploitability = get_exploitability(game, nash_equilibrium)
     print(exploitability)
 
 
-def train(num_iter, log_schedule):
-    game = KuhnPoker()
-    strategy_profile = get_initial_strategy_profile(game.root, game.num_players)
-    average_strategy_profile = deepcopy(strategy_profile)
-    for t in tqdm(range(num_iter)):
-        update_pi(game.root, strategy_profile, average_strategy_profile, [1.0 for _ in range(game.num_players + 1)], [1.0 for _ in range(game.num_players + 1)], [1.0 for _ in range(game.num_players + 1)])
-        update_node_values(game.root, strategy_profile)
-        exploitability = get_exploitability(game, average_strategy_profile)
-        update_strategy(strategy_profile, average_strategy_profile, game.information_sets)
-        if t % log_schedule(t) == 0:
-            logger.logkv("t", t)
-            logger.logkv("exploitability", exploitability)
-            logger.dumpkvs()
-    return average_strategy_profile
+def log_evaluations(evaluations):
+    """
+    estimates of sampled_exploitability are logged with the half width of their confidence interval
+    """
+    for t, exploitability in evaluations:
+        logger.logkv("t", t)
+        logger.logkv("exploitability", float(exploitability))
+        if hasattr(exploitability, "half_width"):
+            logger.logkv("exploitability_ci", exploitability.half_width)
+        logger.dumpkvs()
+
+
+def train(num_iter, log_schedule, vectorized=False, sampling=None, seed=None, eval_schedule=None, background_eval=False,
+          update_rule=None, alternating=False, pruning=None, game=None, checkpoint_path=None, checkpoint_schedule=None,
+          resume=False, num_workers=None, public_tree=False, profile=False, stop_conditions=None, progress_interval=10.0,
+          evaluate=None):
+    """
+    evaluate: function(game, average_strategy_profile) of the evaluations, the exact exploitability by default. For games
+              too large for a best response, sampled_exploitability.SampledExploitability (a lower bound) and
+              SampledBestResponse (an upper bound) estimate it with a bounded number of samples, and their confidence
+              interval is logged as exploitability_ci.
+    stop_conditions: conditions of stopping.py (TargetExploitability, TimeBudget, NodeBudget, Plateau), training stops
+                     before num_iter when one of them is met. The ones on the exploitability see the evaluations of
+                     eval_schedule.
+    progress_interval: seconds between the progress lines written to stderr
+    profile: log the time of the phases of every iteration and the hot-path counters (profiling.py) with the evaluations
+    public_tree: vector-form CFR on the public tree, with vectors over the private hands (public_tree.PublicTreeCFR)
+    num_workers: partition the subtrees of the root chance node across this many worker processes (parallel.ParallelCFR)
+    game: envs.game.Game to solve, KuhnPoker by default. Built with lazy=True, only the visited part of the tree is
+          generated, which is meant for sampling; max_nodes then bounds the memory.
+    vectorized: iterate on the game tree compiled into numpy arrays (flat_tree.FlatCFR)
+    alternating: every iteration updates the players one after another, each traversal updating only one player's
+                 regrets with the strategy the previous player's update produced
+    pruning: pruning.Pruning of the node traversals, the mean number of nodes it skipped per iteration is logged
+             as nodes_pruned
+    sampling: "chance", "external" or "outcome" to run Monte Carlo CFR (mccfr.MCCFR_SOLVERS) seeded with seed
+    update_rule: UpdateRule or its name in update_rules.UPDATE_RULES ("vanilla", "cfr+", "linear", "dcfr"),
+                 used by the full traversal solvers
+    exploitability of the average strategy is evaluated when eval_schedule(t) is True
+    (by default when t % log_schedule(t) == 0), in a worker process if background_eval
+    checkpoint_path: the complete solver state is saved there when checkpoint_schedule(t) is True (every 5 minutes of
+                     wall time by default) and at the end. With resume, training continues from that checkpoint if it
+                     exists, and gives the same result as an uninterrupted run. num_iter counts the iterations before
+                     the checkpoint too.
+    """
+    game = KuhnPoker() if game is None else game
+    evaluator = Evaluator(game, eval_schedule or Modulo(log_schedule), background=background_eval,
+                          evaluate=evaluate or best_response.get_exploitability)
+    checkpointer = Checkpointer(checkpoint_path, checkpoint_schedule) if checkpoint_path is not None else None
+    checkpoint = checkpointer.load() if resume and checkpointer is not None and checkpointer.exists() else None
+    run_kwargs = dict(checkpointer=checkpointer, checkpoint=checkpoint, profile=profile, stop_conditions=stop_conditions,
+                      progress_interval=progress_interval)
+    if sampling is not None:
+        if update_rule is not None or alternating or pruning is not None:
+            raise ValueError("update_rule, alternating and pruning are not supported by Monte Carlo CFR")
+        solver = MCCFR_SOLVERS[sampling](game, seed=seed)
+        return run_solver(solver, num_iter, evaluator, game, **run_kwargs)
+    if pruning is not None:
+        if vectorized:
+            raise ValueError("pruning is not supported by the vectorized solver")
+        set_subtree_sizes(game.root)
+    if num_workers is not None:
+        if vectorized or pruning is not None:
+            raise ValueError("vectorized and pruning are not supported by the parallel solver")
+        solver = ParallelCFR(game, num_workers, update_rule, alternating)
+        try:
+            return run_solver(solver, num_iter, evaluator, **run_kwargs)
+        finally:
+            solver.close()
+    if public_tree:
+        if vectorized or pruning is not None:
+            raise ValueError("vectorized and pruning are not supported by the public tree solver")
+        solver = PublicTreeCFR(PublicTree(game.root, game.num_players), update_rule, alternating)
+        return run_solver(solver, num_iter, evaluator, **run_kwargs)
+    if vectorized:
+        solver = FlatCFR(FlatTree(game.root, game.num_players), update_rule, alternating)
+        return run_solver(solver, num_iter, evaluator, **run_kwargs)
+    solver = TreeCFR(game, update_rule, alternating, pruning)
+    return run_solver(solver, num_iter, evaluator, **run_kwargs)
+
+
+def run_solver(solver, num_iter, evaluator, game=None, checkpointer=None, checkpoint=None, profile=False,
+               stop_conditions=None, progress_interval=10.0):
+    """
+    training loop for the solvers with an iteration() and an average_strategy_profile() method
+    the average strategy profile is only materialized when it is evaluated
+    game: lazily expanded game whose least recently visited subtrees are evicted between iterations
+    checkpointer: checkpoint.Checkpointer saving solver.state_dict(), and checkpoint a state to resume from
+    profile: log the profiling.IterationProfiler values of every iteration
+    stop_conditions: stopping.py conditions checked after every iteration
+    """
+    if checkpoint is not None:
+        solver.load_state_dict(checkpoint)
+        logger.log("resumed from the checkpoint at iteration %d" % solver.t)
+    profiler = profiling.IterationProfiler() if profile else None
+    progress = Progress(solver.t)
+    reporter = ProgressReporter(num_iter, progress_interval)
+    stop_conditions = stop_conditions or []
+    profiling.enable(profile)
+    try:
+        for t in range(solver.t, num_iter):
+            if profiler is not None:
+                profiler.begin()
+            solver.iteration()
+            if game is not None:
+                with profiling.phase("evict"):
+                    game.maybe_evict()
+            with profiling.phase("evaluate"):
+                evaluator.maybe_evaluate(t, solver.average_strategy_profile)
+            if checkpointer is not None:
+                with profiling.phase("checkpoint"):
+                    checkpointer.maybe_save(t, solver.state_dict)
+            if profiler is not None:
+                profiler.end(solver)
+            evaluations = evaluator.poll()
+            if evaluations:
+                log_evaluations(evaluations)
+                progress.evaluations.extend((t, float(exploitability)) for t, exploitability in evaluations)
+            progress.t = t + 1
+            progress.nodes_visited += solver.num_visited
+            reporter.update(progress)
+            stopped = [condition for condition in stop_conditions if condition(progress)]
+            if stopped:
+                reporter.report(progress, message=", stopped by %s" % ", ".join(map(repr, stopped)))
+                logger.log("stopped at t=%d by %s" % (progress.t, ", ".join(map(repr, stopped))))
+                break
+    finally:
+        profiling.enable(False)
+    log_evaluations(evaluator.close())
+    if checkpointer is not None:
+        checkpointer.save(solver.state_dict())
+    return solver.average_strategy_profile()
 
 
 def add_dict_to_dict(d: dict, key):
@@ -181,10 +352,15 @@ def export_strategy_profile_to_yaml(strategy_profile_result):
 
 
 def main():
+    parser = argparse.ArgumentParser(description="train CFR on Kuhn poker")
+    parser.add_argument("--resume", action="store_true", help="continue from ./logs/checkpoint.npz if it exists")
+    args = parser.parse_args()
     logger.configure("./logs")
     num_updates = int(5e7)
-    average_strategy_profile = train(num_updates, lambda x: (10 ** (len(str(x)) - 1)))
+    average_strategy_profile = train(num_updates, lambda x: (10 ** (len(str(x)) - 1)), checkpoint_path="./logs/checkpoint.npz",
+                                     resume=args.resume, stop_conditions=[TargetExploitability(1e-4), Plateau()])
     export_strategy_profile_to_yaml(average_strategy_profile)
+    write_policy_store("./logs/average_strategy.policy", average_strategy_profile)
 
 
 if __name__ == "__main__":
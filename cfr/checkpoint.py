@@ -0,0 +1,73 @@
+"""
+checkpoints of the complete solver state as a single uncompressed .npz file of numpy arrays
+"""
+import os
+
+import numpy as np
+
+from atomic_file import atomic_write
+from evaluation import WallClock
+
+
+def save_checkpoint(path, state: dict):
+    """
+    state: {name: array}
+    written with atomic_file.atomic_write
+    """
+    with atomic_write(path) as f:
+        np.savez(f, **state)
+
+
+def load_checkpoint(path):
+    with np.load(path) as f:
+        return {name: f[name] for name in f.files}
+
+
+def check_solver(state: dict, solver_name: str):
+    if str(state["solver"]) != solver_name:
+        raise ValueError("checkpoint of %s cannot be loaded into %s" % (state["solver"], solver_name))
+
+
+def rng_state(rng):
+    """
+    state of a random.Random as arrays
+    """
+    version, internal_state, gauss_next = rng.getstate()
+    return {
+        "rng_version": np.array(version),
+        "rng_state": np.array(internal_state, dtype=np.uint64),
+        "rng_gauss_next": np.array(np.nan if gauss_next is None else gauss_next),
+    }
+
+
+def set_rng_state(rng, state: dict):
+    gauss_next = float(state["rng_gauss_next"])
+    rng.setstate((int(state["rng_version"]), tuple(int(x) for x in state["rng_state"]),
+                  None if np.isnan(gauss_next) else gauss_next))
+
+
+class Checkpointer:
+    """
+    saves a checkpoint to path when schedule(t) is True (every 5 minutes of wall time by default)
+    """
+    def __init__(self, path, schedule=None):
+        self.path = path
+        self.schedule = WallClock(300) if schedule is None else schedule
+        self.num_saved = 0
+
+    def exists(self):
+        return os.path.exists(self.path)
+
+    def load(self):
+        return load_checkpoint(self.path)
+
+    def maybe_save(self, t, get_state):
+        """
+        get_state is only called when a checkpoint is due
+        """
+        if self.schedule(t):
+            self.save(get_state())
+
+    def save(self, state: dict):
+        save_checkpoint(self.path, state)
+        self.num_saved += 1
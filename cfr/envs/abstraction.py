@@ -0,0 +1,124 @@
+"""
+card and action abstractions of envs.toy_pokers.Poker, given to the game constructor to build a smaller game
+
+    game = Poker(num_ranks=13, bet_sizes=((1, 2, 3, 4), (2, 4, 6, 8)),
+                 card_abstraction=EquityBucketing(4), action_abstraction=BetSizeAbstraction(((2, 4), (4, 8))))
+
+card_abstraction(game, state, player): bucket that replaces the private cards of player in its information sets, so
+the nodes of hands in the same bucket share their information sets (Game.information)
+action_abstraction.actions(game, state, actions): the legal actions kept in the abstract game (Game.actions), and
+action_abstraction.translate maps the actions of the real game onto them at play time
+"""
+import random
+from itertools import permutations
+
+
+class EquityBucketing:
+    """
+    buckets of the private card rank by its equity (probability of winning plus half the probability of a tie) against a
+    uniformly random opponent card, over the board cards still to come
+    given the board, the ranks are sorted by equity and split into num_buckets groups of about the same number of ranks,
+    so the buckets stay meaningful on every board
+    """
+    def __init__(self, num_buckets):
+        self.num_buckets = num_buckets
+        self.buckets = {}  # board ranks -> {rank: bucket}
+
+    def __call__(self, game, state, player):
+        if len(state.cards) == 0:
+            return ()
+        board = tuple(game.rank(card) for card in state.board)
+        buckets = self.buckets.get(board)
+        if buckets is None:
+            buckets = self.buckets[board] = self._buckets(game, state.board)
+        return (buckets[game.rank(state.cards[player])],)
+
+    def _buckets(self, game, board):
+        ranks = sorted(range(game.num_ranks), key=lambda rank: equity(game, rank, board))
+        return {rank: i * self.num_buckets // len(ranks) for i, rank in enumerate(ranks)}
+
+
+def equity(game, rank, board):
+    """
+    equity of a card of rank against a uniformly random opponent card, averaged over the remaining board cards
+    board: physical board cards dealt so far
+    """
+    cards = [card for card in game.deck if card not in board and game.rank(card) == rank]
+    if not cards:  # every card of rank is on the board: any physical card has the same equity, none can be held
+        return 0.0
+    card = cards[0]  # the suits do not matter
+    deck = [c for c in game.deck if c != card and c not in board]
+    total, count = 0.0, 0
+    for opponent_card in deck:
+        rest = [c for c in deck if c != opponent_card]
+        for future_board in permutations(rest, game.num_rounds - 1 - len(board)):
+            full_board = tuple(board) + future_board
+            strength, opponent_strength = game._hand_strength(card, full_board), game._hand_strength(opponent_card, full_board)
+            total += 1.0 if strength > opponent_strength else 0.5 if strength == opponent_strength else 0.0
+            count += 1
+    return total / count
+
+
+class BetSizeAbstraction:
+    """
+    bet_sizes[round]: the bet and raise sizes of the real game that are kept in round
+    translate maps an action of any size onto the kept sizes with the pseudo-harmonic mapping
+    (Action Translation in Extensive-Form Games with Large Action Spaces, S. Ganzfried, T. Sandholm. IJCAI 2013)
+    """
+    def __init__(self, bet_sizes):
+        self.bet_sizes = [tuple(sizes) for sizes in bet_sizes]
+
+    def actions(self, game, state, actions):
+        return [action for action in actions if _size(game, state.round, action) in (None,) + self.bet_sizes[state.round]]
+
+    def translation_probabilities(self, game, state, action, size=None):
+        """
+        {abstract action: probability} of the real action (a label of the real game, whose size is given when the label
+        does not tell it) at state of the abstract game
+        """
+        kind = action.split(":")[0]
+        legal_actions = game.actions(state)
+        if kind not in ("bet", "raise"):
+            return {action: 1.0}
+        sized = {_size(game, state.round, a): a for a in legal_actions if a.split(":")[0] == kind}
+        if not sized:  # no bet left in the abstract game
+            return {"call" if "call" in legal_actions else "check": 1.0}
+        if size is None:
+            size = _size(game, state.round, action) if ":" not in action else int(action.split(":")[1])
+        if size is None:
+            raise ValueError("the size of %s is needed" % action)
+        pot = sum(state.contributions)
+        x = size / pot
+        sizes = sorted(sized)
+        if size <= sizes[0]:
+            return {sized[sizes[0]]: 1.0}
+        if size >= sizes[-1]:
+            return {sized[sizes[-1]]: 1.0}
+        upper = next(s for s in sizes if s >= size)
+        lower = sizes[sizes.index(upper) - 1]
+        if upper == size:
+            return {sized[upper]: 1.0}
+        a, b = lower / pot, upper / pot  # sizes as fractions of the pot
+        p = (b - x) * (1 + a) / ((b - a) * (1 + x))
+        return {sized[lower]: p, sized[upper]: 1 - p}
+
+    def translate(self, game, state, action, size=None, rng=None):
+        """
+        abstract action of the real action, sampled with the pseudo-harmonic probabilities when rng is given, the most
+        probable one otherwise
+        """
+        probabilities = self.translation_probabilities(game, state, action, size)
+        if rng is None:
+            return max(probabilities, key=probabilities.get)
+        rng = rng if isinstance(rng, random.Random) else random.Random(rng)
+        actions = list(probabilities)
+        return rng.choices(actions, [probabilities[a] for a in actions])[0]
+
+
+def _size(game, round, action):
+    """
+    size of a bet or raise action, None for the other actions
+    """
+    if action in game.bets[round]:
+        return game.bets[round][action]
+    return game.raises[round].get(action)
@@ -0,0 +1,298 @@
+def add_list_to_dict(target_dict, key, value):
+    if key in target_dict.keys():
+        target_dict[key].append(value)
+    else:
+        target_dict[key] = [value]
+
+
+class Node:
+    __slots__ = ("children", "child_nodes", "player", "terminal", "private_cards", "history", "information", "eu", "info_id",
+                 "subtree_size", "pruned")
+
+    def __init__(self, player, terminal, eu=0):
+        self.children = {}
+        self.child_nodes = []  # children in action slot order, for traversals by index
+        self.player = player
+        self.terminal = terminal
+        self.private_cards = []
+        self.history = []
+        self.information = ((), ())  # (private card, history)
+
+        self.eu = eu
+        self.info_id = -1  # row of the information set in infoset_table.InfosetTable
+        self.subtree_size = 1  # set by pruning.set_subtree_sizes
+        self.pruned = False  # skipped by the current traversal
+
+    def expand_child_node(self, action, next_player, terminal, utility=0, private_cards=None):
+        next_node = Node(next_player, terminal, utility)
+        self.children[action] = next_node
+        self.child_nodes.append(next_node)
+        next_node.private_cards = self.private_cards if private_cards is None else private_cards
+        next_node.history = self.history + [action] if self.player != -1 else self.history
+        next_node.information = (next_node.private_cards[next_player], tuple(next_node.history))
+        return next_node
+
+    def actions(self):
+        return list(self.children)
+
+    def child(self, action):
+        """
+        child node after action, the only one a sampling traversal needs to exist
+        """
+        return self.children[action]
+
+
+class LazyNode(Node):
+    """
+    node of a Game built with lazy=True: its children are generated from the rules of the game when they are first
+    accessed, and Game.evict can drop them again. child(action) generates that child alone, so that sampling does not
+    build the siblings of the sampled child.
+    last_visit: value of game.clock when the children were last accessed
+    """
+    __slots__ = ("game", "state", "_children", "_child_nodes", "_partial", "_actions", "last_visit")
+
+    def __init__(self, game, state, player, terminal, eu=0):
+        super().__init__(player, terminal, eu)
+        self.game = game
+        self.state = state
+        self._children = {} if terminal else None  # None until expanded
+        self._child_nodes = [] if terminal else None
+        self._partial = None  # {action: child node} generated by child() before the node is expanded
+        self._actions = None  # game.actions(state), cached by actions() before the node is expanded
+        self.last_visit = 0
+
+    @property
+    def expanded(self):
+        return self._children is not None
+
+    def existing_child_nodes(self):
+        """
+        the child nodes generated so far, without generating the others
+        """
+        if self._children is not None:
+            return self._child_nodes
+        return list(self._partial.values()) if self._partial else []
+
+    def actions(self):
+        if self._children is not None:
+            return list(self._children)
+        if self._actions is None:
+            self._actions = self.game.actions(self.state)
+        return self._actions
+
+    def child(self, action):
+        self.game.clock += 1
+        self.last_visit = self.game.clock
+        if self._children is not None:
+            return self._children[action]
+        return self.game.expand_child(self, action)
+
+    @property
+    def children(self):
+        if self._children is None:
+            self.game.expand(self)
+        self.game.clock += 1
+        self.last_visit = self.game.clock
+        return self._children
+
+    @children.setter
+    def children(self, children):
+        self._children = children
+
+    @property
+    def child_nodes(self):
+        if self._children is None:
+            self.game.expand(self)
+        self.game.clock += 1
+        self.last_visit = self.game.clock
+        return self._child_nodes
+
+    @child_nodes.setter
+    def child_nodes(self, child_nodes):
+        self._child_nodes = child_nodes
+
+
+class Game:
+    """
+    declarative definition of a game: subclasses describe the rules as functions of immutable states, and the
+    constructor builds the Node tree and information_sets from them
+
+    chance outcomes are equally likely, as the solvers assume. Non-uniform distributions can be written by repeating
+    outcomes under different labels (e.g. the physical cards of a deck whose ranks repeat).
+    utilities are those of player 0 (two-player zero-sum)
+
+    lazy: only create the root, and generate the children of a node when a traversal first reaches it (LazyNode), so
+          that sampling traversals only build the part of the tree they visit. information_sets then contains the
+          nodes that exist. Full traversals (and exploitability) still expand the whole tree.
+    max_nodes: with lazy, maybe_evict drops the least recently visited subtrees once more than max_nodes nodes exist
+    card_abstraction(game, state, player): bucket replacing the private cards of player in its information sets
+    action_abstraction: its actions(game, state, legal_actions) are the actions of the players in the tree
+    (see envs.abstraction). Node.private_cards keeps the real cards.
+    """
+    num_players = 2
+
+    def __init__(self, lazy=False, max_nodes=None, card_abstraction=None, action_abstraction=None):
+        self.lazy = lazy
+        self.max_nodes = max_nodes
+        self.card_abstraction = card_abstraction
+        self.action_abstraction = action_abstraction
+        self.num_nodes = 0  # nodes that currently exist
+        self.clock = 0  # incremented on every access to the children of a LazyNode
+        self.information_sets = {player: {} for player in range(-1, self.num_players)}
+        if lazy:
+            self.root = self._make_node(self.initial_state())
+        else:
+            self.root = self._build_game_tree()
+
+    def initial_state(self):
+        raise NotImplementedError
+
+    def current_player(self, state):
+        """
+        player to act, -1 for chance
+        """
+        raise NotImplementedError
+
+    def is_terminal(self, state):
+        raise NotImplementedError
+
+    def terminal_utility(self, state):
+        raise NotImplementedError
+
+    def chance_outcomes(self, state):
+        raise NotImplementedError
+
+    def legal_actions(self, state):
+        raise NotImplementedError
+
+    def next_state(self, state, action):
+        """
+        action is a legal action or a chance outcome
+        """
+        raise NotImplementedError
+
+    def private_cards(self, state):
+        """
+        [private cards of player 0, private cards of player 1, ..., cards known only to chance]
+        """
+        raise NotImplementedError
+
+    def public_history(self, state):
+        """
+        actions and chance outcomes every player observes
+        """
+        raise NotImplementedError
+
+    def information(self, state, player):
+        """
+        key of the information set of player at state
+        chance and terminal nodes use the cards known only to chance, so that chance nodes with different outcomes do
+        not share a key
+        """
+        if self.card_abstraction is not None and player != -1:
+            return self.card_abstraction(self, state, player), tuple(self.public_history(state))
+        return self.private_cards(state)[player], tuple(self.public_history(state))
+
+    def actions(self, state):
+        if self.current_player(state) == -1:
+            return self.chance_outcomes(state)
+        if self.action_abstraction is not None:
+            return self.action_abstraction.actions(self, state, self.legal_actions(state))
+        return self.legal_actions(state)
+
+    def _build_game_tree(self):
+        state = self.initial_state()
+        root = self._make_node(state)
+        stack = [(root, state)]
+        while stack:
+            node, state = stack.pop()
+            for action in self.actions(state):
+                next_state = self.next_state(state, action)
+                child_node = self._make_node(next_state)
+                node.children[action] = child_node
+                node.child_nodes.append(child_node)
+                if not child_node.terminal:
+                    stack.append((child_node, next_state))
+        return root
+
+    def _make_node(self, state):
+        terminal = self.is_terminal(state)
+        player = -1 if terminal else self.current_player(state)
+        utility = self.terminal_utility(state) if terminal else 0
+        if self.lazy:
+            node = LazyNode(self, state, player, terminal, utility)
+        else:
+            node = Node(player, terminal, utility)
+        node.private_cards = self.private_cards(state)
+        node.history = list(self.public_history(state))
+        node.information = self.information(state, player)
+        add_list_to_dict(self.information_sets[player], node.information, node)
+        self.num_nodes += 1
+        return node
+
+    def expand(self, node: LazyNode):
+        """
+        generate the children of node, keeping the ones expand_child already generated
+        """
+        partial = node._partial or {}
+        children = {}
+        for action in self.actions(node.state):
+            child_node = partial.get(action)
+            children[action] = self._make_node(self.next_state(node.state, action)) if child_node is None else child_node
+        node._children = children
+        node._child_nodes = list(children.values())
+        node._partial = node._actions = None
+
+    def expand_child(self, node: LazyNode, action):
+        """
+        generate the child of node after action alone
+        """
+        if node._partial is None:
+            node._partial = {}
+        child_node = node._partial.get(action)
+        if child_node is None:
+            child_node = node._partial[action] = self._make_node(self.next_state(node.state, action))
+        return child_node
+
+    def maybe_evict(self):
+        """
+        evict down to half of max_nodes once it is exceeded
+        call it between traversals: the nodes of an evicted subtree are detached from the tree
+        """
+        if self.lazy and self.max_nodes is not None and self.num_nodes > self.max_nodes:
+            self.evict(self.max_nodes // 2)
+
+    def evict(self, target_nodes):
+        """
+        drop the generated children of the least recently visited nodes until at most target_nodes nodes exist
+        the dropped nodes are generated again if a traversal reaches them, so nothing but time is lost as long as
+        the solver keeps its regrets and strategies outside of the nodes (e.g. mccfr)
+        """
+        expanded = []
+        stack = [self.root]
+        while stack:
+            node = stack.pop()
+            child_nodes = node.existing_child_nodes()
+            if child_nodes:
+                expanded.append(node)
+                stack.extend(child_nodes)
+        expanded.sort(key=lambda node: node.last_visit)
+        for node in expanded:
+            if self.num_nodes <= target_nodes:
+                break
+            if node.existing_child_nodes():  # not already dropped with an ancestor
+                self._collapse(node)
+
+    def _collapse(self, node: LazyNode):
+        stack = list(node.existing_child_nodes())
+        while stack:
+            child_node = stack.pop()
+            nodes = self.information_sets[child_node.player][child_node.information]
+            nodes.remove(child_node)
+            if not nodes:
+                del self.information_sets[child_node.player][child_node.information]
+            self.num_nodes -= 1
+            stack.extend(child_node.existing_child_nodes())
+            if not child_node.terminal:
+                child_node._children = child_node._child_nodes = child_node._partial = None
+        node._children = node._child_nodes = node._partial = None
@@ -1,43 +1,7 @@
-from collections import deque
-from itertools import combinations
-
-
-def add_list_to_dict(target_dict, key, value):
-    if key in target_dict.keys():
-        target_dict[key].append(value)
-    else:
-        target_dict[key] = [value]
-
-
-class Node:
-    def __init__(self, player, terminal, eu=0):
-        self.children = {}
-        self.player = player
-        self.terminal = terminal
-        self.private_cards = []
-        self.history = []
-        self.information = ((), ())  # (private card, history)
-
-        self.pi = 0
-        self.pi_mi = 0  # pi_-i
-        self.pi_i = 0  # pi_i
-        self.true_pi_mi = 0  # pi_-i following current average strategy profile
-        self.eu = eu
-        self.cv = 0
-        self.cfr = {}  # counter-factual regret of not taking action a at history h(not information I)
-        self.pi_i_sum = 0  # denominator of average strategy
-        self.pi_sigma_sum = {}  # numerator of average strategy
-        self.num_updates = 0
-
-    def expand_child_node(self, action, next_player, terminal, utility=0, private_cards=None):
-        next_node = Node(next_player, terminal, utility)
-        self.children[action] = next_node
-        self.cfr[action] = 0
-        self.pi_sigma_sum[action] = 0
-        next_node.private_cards = self.private_cards if private_cards is None else private_cards
-        next_node.history = self.history + [action] if self.player != -1 else self.history
-        next_node.information = (next_node.private_cards[next_player], tuple(next_node.history))
-        return next_node
+from collections import namedtuple
+from itertools import permutations
+
+from envs.game import Game, Node
 
 
 class Card:
@@ -52,60 +16,127 @@ class Card:
             return str(self.rank) + str(self.suit)
 
 
-class KuhnPoker:
-    def __init__(self):
-        self.num_players = 2
-        self.deck = [i for i in range(3)]
-        self.information_sets = {player: {} for player in range(-1, self.num_players)}
-        self.root = self._build_game_tree()
-
-    def _build_game_tree(self):
-        stack = deque()
-        next_player = -1
-        root = Node(next_player, False)
-        add_list_to_dict(self.information_sets[next_player], root.information, root)
-        for hand_0 in combinations(self.deck, 1):
-            for hand_1 in combinations(self.deck, 1):
-                if set(hand_0) & set(hand_1):
-                    continue
-                private_cards = [hand_0, hand_1, ()]  # p1, p2, chance player
-                next_player = 0
-                node = root.expand_child_node(str(*hand_0) + ',' + str(*hand_1), next_player, False, private_cards=private_cards)
-                add_list_to_dict(self.information_sets[next_player], node.information, node)
-                stack.append(node)
-                for action in ['check', 'bet']:  # player 0 actions
-                    next_player = 1
-                    node = node.expand_child_node(action, next_player, False)
-                    add_list_to_dict(self.information_sets[next_player], node.information, node)
-                    stack.append(node)
-                    if action == 'check':
-                        for action in ['check', 'bet']:  # player 1 actions
-                            if action == 'check':
-                                utility = self._compute_utility(action, next_player, hand_0, hand_1)
-                                next_player = -1
-                                node = node.expand_child_node(action, next_player, True, utility)
-                                add_list_to_dict(self.information_sets[next_player], node.information, node)
-                                node = stack.pop()
-                            if action == 'bet':
-                                next_player = 0
-                                node = node.expand_child_node(action, next_player, False)
-                                add_list_to_dict(self.information_sets[next_player], node.information, node)
-                                stack.append(node)
-                                for action in ['fold', 'call']:  # player 0 actions
-                                    utility = self._compute_utility(action, next_player, hand_0, hand_1)
-                                    next_player = -1
-                                    node = node.expand_child_node(action, next_player, True, utility)
-                                    add_list_to_dict(self.information_sets[next_player], node.information, node)
-                                    node = stack.pop()
-                    if action == 'bet':
-                        stack.append(node)
-                        for action in ['fold', 'call']:  # player 1 actions
-                            utility = self._compute_utility(action, next_player, hand_0, hand_1)
-                            next_player = -1
-                            node = node.expand_child_node(action, next_player, True, utility)
-                            add_list_to_dict(self.information_sets[next_player], node.information, node)
-                            node = stack.pop()
-        return root
+PokerState = namedtuple("PokerState", [
+    "cards",  # physical card of each player, () before the deal
+    "board",  # physical board cards dealt so far
+    "round",  # betting round, num_rounds once the showdown is reached
+    "history",  # public history: actions and board card ranks
+    "round_actions",  # actions of the current betting round
+    "contributions",  # chips each player has put in the pot
+    "num_raises",  # bets and raises in the current betting round
+    "folded",  # player who folded, or None
+])
+
+
+class Poker(Game):
+    """
+    two-player limit poker with one private card per player
+    the deck has num_ranks ranks of num_suits cards each, and the physical cards are dealt uniformly. Players see the
+    rank only. Both players ante, then num_rounds betting rounds follow, with one public board card dealt before every
+    round but the first. Player 0 acts first in every round, and at most max_raises bets and raises are made per round.
+    bet_sizes[round]: the bet and raise sizes allowed in round; with several sizes the actions are named "bet:<size>"
+    and "raise:<size>", otherwise "bet" and "raise"
+    At the showdown, the hand whose rank is paired the most times on the board wins, then the higher rank.
+    card_abstraction, action_abstraction: see envs.abstraction
+    """
+    def __init__(self, num_ranks=3, num_suits=2, num_rounds=2, bet_sizes=((2,), (4,)), max_raises=2, ante=1, lazy=False,
+                 max_nodes=None, card_abstraction=None, action_abstraction=None):
+        if len(bet_sizes) != num_rounds:
+            raise ValueError("bet_sizes needs the sizes of each of the %d rounds: %s" % (num_rounds, bet_sizes))
+        if num_ranks * num_suits < self.num_players + num_rounds - 1:
+            raise ValueError("the deck is too small to deal %d rounds" % num_rounds)
+        self.num_ranks = num_ranks
+        self.num_suits = num_suits
+        self.num_rounds = num_rounds
+        self.max_raises = max_raises
+        self.ante = ante
+        self.deck = [i for i in range(num_ranks * num_suits)]
+        self.bets = [self._sized_actions("bet", sizes) for sizes in bet_sizes]  # round -> {action: size}
+        self.raises = [self._sized_actions("raise", sizes) for sizes in bet_sizes]
+        super().__init__(lazy, max_nodes, card_abstraction, action_abstraction)
+
+    @staticmethod
+    def _sized_actions(name, sizes):
+        if len(sizes) == 1:
+            return {name: sizes[0]}
+        return {"%s:%d" % (name, size): size for size in sizes}
+
+    def rank(self, card):
+        return card // self.num_suits
+
+    def initial_state(self):
+        return PokerState((), (), 0, (), (), (self.ante,) * self.num_players, 0, None)
+
+    def current_player(self, state):
+        if len(state.cards) == 0 or len(state.board) < state.round:
+            return -1
+        return len(state.round_actions) % self.num_players
+
+    def is_terminal(self, state):
+        return state.folded is not None or state.round == self.num_rounds
+
+    def terminal_utility(self, state):
+        if state.folded is not None:
+            return -state.contributions[0] if state.folded == 0 else state.contributions[1]
+        strength_0, strength_1 = (self._hand_strength(card, state.board) for card in state.cards)
+        if strength_0 == strength_1:
+            return 0
+        return state.contributions[1] if strength_0 > strength_1 else -state.contributions[0]
+
+    def _hand_strength(self, card, board):
+        rank = self.rank(card)
+        return sum(self.rank(board_card) == rank for board_card in board), rank
+
+    def chance_outcomes(self, state):
+        if len(state.cards) == 0:
+            return [",".join(map(str, cards)) for cards in permutations(self.deck, self.num_players)]
+        return [str(card) for card in self.deck if card not in state.cards and card not in state.board]
+
+    def legal_actions(self, state):
+        player = self.current_player(state)
+        can_raise = state.num_raises < self.max_raises
+        if state.contributions[player] == max(state.contributions):
+            return ["check"] + (list(self.bets[state.round]) if can_raise else [])
+        return ["fold", "call"] + (list(self.raises[state.round]) if can_raise else [])
+
+    def next_state(self, state, action):
+        if len(state.cards) == 0:
+            return state._replace(cards=tuple(int(card) for card in action.split(",")))
+        if len(state.board) < state.round:
+            card = int(action)
+            return state._replace(board=state.board + (card,), history=state.history + ("board:%d" % self.rank(card),))
+        player = self.current_player(state)
+        state = state._replace(history=state.history + (action,), round_actions=state.round_actions + (action,))
+        if action == "fold":
+            return state._replace(folded=player)
+        contributions = list(state.contributions)
+        if action in self.bets[state.round] or action in self.raises[state.round]:
+            size = self.bets[state.round].get(action) or self.raises[state.round][action]
+            contributions[player] = max(contributions) + size
+            state = state._replace(num_raises=state.num_raises + 1)
+        elif action == "call":
+            contributions[player] = max(contributions)
+        state = state._replace(contributions=tuple(contributions))
+        if action == "call" or (action == "check" and len(state.round_actions) == self.num_players):
+            state = state._replace(round=state.round + 1, round_actions=(), num_raises=0)
+        return state
+
+    def private_cards(self, state):
+        if len(state.cards) == 0:
+            return [() for _ in range(self.num_players + 1)]
+        return [(self.rank(card),) for card in state.cards] + [state.cards]
+
+    def public_history(self, state):
+        return state.history
+
+
+class KuhnPoker(Poker):
+    """
+    3 cards, one betting round of a single bet of 1
+    """
+    def __init__(self, lazy=False, max_nodes=None):
+        super().__init__(num_ranks=3, num_suits=1, num_rounds=1, bet_sizes=((1,),), max_raises=1, ante=1, lazy=lazy,
+                         max_nodes=max_nodes)
 
     def get_nash_equilibrium(self, node: Node, strategy_profile=None):
         """
@@ -178,18 +209,13 @@ class KuhnPoker:
         return strategy_profile
 
 
-    def _compute_utility(self, action, player, hand_0, hand_1):
-        card_0, card_1 = hand_0[0], hand_1[0]
-        is_win = card_0 > card_1
-        if action == "fold":
-            utility = 1 if player == 1 else -1
-        elif action == "check":
-            utility = 1 if is_win else -1
-        elif action == "call":
-            utility = 2 if is_win else -2
-        else:
-            utility = 0
-        return utility
+class LeducHoldem(Poker):
+    """
+    two suits of 3 ranks, bets of 2 in the first round and 4 in the second, a bet and a raise per round
+    """
+    def __init__(self, lazy=False, max_nodes=None):
+        super().__init__(num_ranks=3, num_suits=2, num_rounds=2, bet_sizes=((2,), (4,)), max_raises=2, ante=1, lazy=lazy,
+                         max_nodes=max_nodes)
 
 
 if __name__ == "__main__":
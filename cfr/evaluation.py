@@ -0,0 +1,124 @@
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import best_response
+
+
+class EveryN:
+    """
+    due every n iterations
+    """
+    def __init__(self, n):
+        self.n = n
+
+    def __call__(self, t):
+        return t % self.n == 0
+
+
+class LogSpaced:
+    """
+    due `per_decade` times per decade, e.g. t = 0, 1, ..., 9, 10, 20, ..., 90, 100, 200, ... for per_decade=9
+    """
+    def __init__(self, per_decade=9):
+        self.per_decade = per_decade
+
+    def __call__(self, t):
+        if t < 10:
+            return True
+        step = max(10 ** (len(str(t)) - 1) * 9 // self.per_decade, 1)
+        return t % step == 0
+
+
+class Modulo:
+    """
+    adapter for the `log_schedule` functions of train: due when t % log_schedule(t) == 0
+    """
+    def __init__(self, log_schedule):
+        self.log_schedule = log_schedule
+
+    def __call__(self, t):
+        return t % self.log_schedule(t) == 0
+
+
+class WallClock:
+    """
+    due at the first iteration and then every `seconds` of wall time
+    """
+    def __init__(self, seconds):
+        self.seconds = seconds
+        self.last = None
+
+    def __call__(self, t):
+        now = time.time()
+        if self.last is None or now - self.last >= self.seconds:
+            self.last = now
+            return True
+        return False
+
+
+_worker_game = None
+_worker_evaluate = None
+
+
+def _init_worker(game, evaluate):
+    global _worker_game, _worker_evaluate
+    _worker_game = game
+    _worker_evaluate = evaluate
+
+
+def _evaluate(average_strategy_profile):
+    return _worker_evaluate(_worker_game, average_strategy_profile)
+
+
+class Evaluator:
+    """
+    exploitability evaluation as a separate stage of training with its own schedule
+    with background=True, the evaluation runs in a worker process against a snapshot of the average strategy,
+    and at most `max_pending` evaluations are in flight (due evaluations are skipped while the worker is busy)
+    evaluate(game, average_strategy_profile): the exact exploitability by default, or e.g. an estimate of
+    sampled_exploitability.SampledExploitability or SampledBestResponse (it must be picklable to run in the background)
+    """
+    def __init__(self, game, schedule, background=False, max_pending=1, evaluate=best_response.get_exploitability):
+        self.game = game
+        self.schedule = schedule
+        self.evaluate = evaluate
+        self.max_pending = max_pending
+        self.pending = []  # [(t, future)]
+        self.finished = []  # [(t, exploitability)]
+        self.num_skipped = 0
+        self.executor = ProcessPoolExecutor(max_workers=1, initializer=_init_worker, initargs=(game, evaluate)) if background else None
+
+    def maybe_evaluate(self, t, get_average_strategy_profile):
+        """
+        get_average_strategy_profile is only called when an evaluation is due
+        """
+        if not self.schedule(t):
+            return
+        if self.executor is None:
+            self.finished.append((t, self.evaluate(self.game, get_average_strategy_profile())))
+        elif len(self.pending) < self.max_pending:
+            self.pending.append((t, self.executor.submit(_evaluate, get_average_strategy_profile())))  # pickled, i.e. a snapshot
+        else:
+            self.num_skipped += 1
+
+    def poll(self):
+        """
+        [(t, exploitability)] of the evaluations finished since the last call, in order of t
+        """
+        while self.pending and self.pending[0][1].done():
+            t, future = self.pending.pop(0)
+            self.finished.append((t, future.result()))
+        finished, self.finished = self.finished, []
+        return finished
+
+    def close(self):
+        """
+        wait for the pending evaluations and return their results
+        """
+        for t, future in self.pending:
+            self.finished.append((t, future.result()))
+        self.pending = []
+        if self.executor is not None:
+            self.executor.shutdown()
+            self.executor = None
+        return self.poll()
@@ -0,0 +1,151 @@
+from collections import deque
+
+import numpy as np
+
+import profiling
+from envs.game import Node
+from infoset_table import InfosetTable, TableSolver
+from update_rules import get_update_rule
+
+
+class FlatTree:
+    """
+    game tree compiled into contiguous arrays
+    nodes are stored in breadth-first order, so every depth is a contiguous slice and
+    the parents of a level are a contiguous slice of the previous level
+    information set ids and action slots are those of an InfosetTable
+    """
+    def __init__(self, root: Node, num_players: int, table=None):
+        self.num_players = num_players
+        self.table = InfosetTable(num_players) if table is None else table
+
+        player, terminal, utility, infoset = [], [], [], []
+        parent, edge_slot, chance_prob, depth = [], [], [], []
+        queue = deque([(root, -1, -1, 1.0, 0)])
+        while queue:
+            node, parent_id, slot, p, d = queue.popleft()
+            node_id = len(player)
+            player.append(node.player)
+            terminal.append(node.terminal)
+            utility.append(node.eu if node.terminal else 0.0)
+            parent.append(parent_id)
+            edge_slot.append(slot)
+            chance_prob.append(p)
+            depth.append(d)
+            if node.terminal:
+                infoset.append(-1)
+                continue
+            node.info_id = self.table.add(node.player, node.information, tuple(node.children))
+            infoset.append(node.info_id)
+            for slot, child in enumerate(node.children.values()):
+                queue.append((child, node_id, slot, 1 / len(node.children) if node.player == -1 else 1.0, d + 1))
+
+        self.num_nodes = len(player)
+        self.player = np.array(player, dtype=np.int64)
+        self.terminal = np.array(terminal, dtype=bool)
+        self.utility = np.array(utility, dtype=np.float64)  # player 0's utility at terminal nodes
+        self.infoset = np.array(infoset, dtype=np.int64)  # -1 for terminal nodes
+        self.parent = np.array(parent, dtype=np.int64)  # -1 for the root
+        self.edge_slot = np.array(edge_slot, dtype=np.int64)  # slot of the action leading to the node
+        self.chance_prob = np.array(chance_prob, dtype=np.float64)  # probability of a chance edge, 1 otherwise
+        self.edge_player = np.where(self.parent >= 0, self.player[self.parent], -1)
+        self.edge_infoset = np.where(self.parent >= 0, self.infoset[self.parent], -1)
+        self.level_starts = np.searchsorted(np.array(depth), np.arange(max(depth) + 2))
+
+    @property
+    def num_levels(self):
+        return len(self.level_starts) - 1
+
+    def level(self, depth):
+        return slice(int(self.level_starts[depth]), int(self.level_starts[depth + 1]))
+
+
+class FlatCFR(TableSolver):
+    """
+    CFR over a FlatTree, with the regrets and strategy sums of its InfosetTable
+    reach probabilities flow down and expected values flow up level by level with vectorized ops
+    with alternating=True, each iteration updates the players one after another
+    """
+    def __init__(self, tree: FlatTree, update_rule=None, alternating=False):
+        self.tree = tree
+        self.table = tree.table
+        self.update_rule = get_update_rule(update_rule)
+        self.alternating = alternating
+        self.t = 0  # number of iterations done
+        self.num_visited = 0  # nodes visited in the last iteration
+        self.num_updated = 0  # information sets updated in the last iteration
+
+        self.player_edges = np.flatnonzero(tree.edge_player >= 0)
+        self.edge_index = tree.edge_infoset * self.table.max_actions + tree.edge_slot  # only meaningful for player edges
+        self.sign = np.where(tree.player == 0, 1.0, -1.0)  # utilities are stored from player 0's point of view
+        self.reach = np.ones((tree.num_players + 1, tree.num_nodes))  # last row is the chance player (index -1)
+        self.value = np.zeros(tree.num_nodes)
+        if alternating:
+            self.update_groups = [self._update_group([player]) for player in range(tree.num_players)]
+        else:
+            self.update_groups = [self._update_group(range(tree.num_players))]
+
+    def _update_group(self, players):
+        """
+        indices of the nodes, edges and infosets whose values are updated together
+        """
+        tree = self.tree
+        nodes = {player: np.flatnonzero(~tree.terminal & (tree.player == player)) for player in players}
+        edges = self.player_edges[np.isin(tree.edge_player[self.player_edges], list(players))]
+        return nodes, edges, self.table.rows(players)
+
+    def iteration(self):
+        self.t += 1
+        for nodes, edges, rows in self.update_groups:
+            self._update(nodes, edges, rows)
+        self.num_visited = self.tree.num_nodes * len(self.update_groups)
+        self.num_updated = sum(len(rows) for _, _, rows in self.update_groups)
+
+    def _update(self, nodes, edges, rows):
+        with profiling.phase("traverse"):
+            self._traverse(nodes, edges)
+        with profiling.phase("update"):
+            self.table.discount(self.t, self.update_rule, rows)
+            self.table.regret_matching(rows)
+
+    def _traverse(self, nodes, edges):
+        """
+        accumulate the regrets and the average strategy of the current strategy
+        """
+        tree, table = self.tree, self.table
+        edge_prob = tree.chance_prob.copy()
+        edge_prob[self.player_edges] = table.strategy.ravel()[self.edge_index[self.player_edges]]
+        reach = self._update_reach(edge_prob)
+        value = self._update_value(edge_prob)
+
+        counterfactual_reach = np.ones(tree.num_nodes)
+        own_reach = np.zeros(tree.num_nodes)
+        for player, player_nodes in nodes.items():
+            counterfactual_reach[player_nodes] = np.prod(np.delete(reach[:, player_nodes], player, axis=0), axis=0)
+            own_reach[player_nodes] = reach[player, player_nodes]
+
+        h = tree.parent[edges]
+        regret = self.sign[h] * counterfactual_reach[h] * (value[edges] - value[h])
+        table.regret += np.bincount(self.edge_index[edges], weights=regret, minlength=table.regret.size).reshape(table.regret.shape)
+
+        info_nodes = np.concatenate(list(nodes.values()))
+        table.add_reach(np.bincount(tree.infoset[info_nodes], weights=own_reach[info_nodes], minlength=table.num_infosets))
+
+    def _update_reach(self, edge_prob):
+        tree = self.tree
+        reach = self.reach
+        for depth in range(1, tree.num_levels):
+            level = tree.level(depth)
+            reach[:, level] = reach[:, tree.parent[level]]
+            reach[tree.edge_player[level], np.arange(level.start, level.stop)] *= edge_prob[level]
+        return reach
+
+    def _update_value(self, edge_prob):
+        tree = self.tree
+        value = self.value
+        value[:] = tree.utility
+        for depth in reversed(range(1, tree.num_levels)):
+            level, parent_level = tree.level(depth), tree.level(depth - 1)
+            value[parent_level] += np.bincount(tree.parent[level] - parent_level.start, weights=edge_prob[level] * value[level],
+                                               minlength=parent_level.stop - parent_level.start)
+        return value
@@ -0,0 +1,246 @@
+import numpy as np
+
+from checkpoint import check_solver
+from envs.game import Node
+from update_rules import get_update_rule
+
+
+class InfosetTable:
+    """
+    regrets, average strategy sums and current strategy of every information set, as dense arrays indexed by
+    (infoset id, action slot), the slots following the order of node.children
+    chance nodes get rows too, with a fixed uniform strategy, so that every edge probability is read the same way
+
+    traversals in Python accumulate into the list buffers regret_delta / reach_delta (much cheaper than item access on
+    numpy arrays), which apply_deltas adds to the arrays once per iteration
+    """
+    def __init__(self, num_players: int, max_actions=2, capacity=16):
+        self.num_players = num_players
+        self.index = {}  # (player, information) -> infoset id
+        self.keys = []  # infoset id -> (player, information)
+        self.actions = []  # infoset id -> tuple of actions
+        self.num_infosets = 0
+        self.max_actions = max_actions
+        self.player = np.zeros(capacity, dtype=np.int64)
+        self.num_actions = np.ones(capacity, dtype=np.int64)
+        self.regret = np.zeros((capacity, max_actions))  # cumulative counterfactual regret
+        self.strategy_sum = np.zeros((capacity, max_actions))  # numerator of average strategy
+        self.reach_sum = np.zeros(capacity)  # denominator of average strategy
+        self.strategy = np.zeros((capacity, max_actions))  # current strategy
+        self.strategy_rows = []  # current strategy as lists, for traversals in Python
+        self.regret_delta = []
+        self.reach_delta = []
+        self._rows = {}
+        self._key_array = None
+        self.version = 0  # incremented whenever the average strategy sums change
+        self._average_strategy_profile = None  # (version, profile)
+
+    @classmethod
+    def from_tree(cls, root: Node, num_players: int):
+        return cls(num_players).index_tree(root)
+
+    def index_tree(self, root: Node):
+        """
+        add the information sets of every node under root and set node.info_id
+        """
+        stack = [root]
+        while stack:
+            node = stack.pop()
+            if node.terminal:
+                continue
+            node.info_id = self.add(node.player, node.information, tuple(node.children))
+            stack.extend(node.children.values())
+        return self
+
+    def add(self, player: int, information, actions: tuple):
+        key = (player, information)
+        info_id = self.index.get(key)
+        if info_id is not None:
+            if self.actions[info_id] != actions:
+                raise ValueError("actions of %s differ between nodes: %s, %s" % (key, self.actions[info_id], actions))
+            return info_id
+        info_id = self.num_infosets
+        if info_id == len(self.player) or len(actions) > self.max_actions:
+            self._resize(max(2 * len(self.player), info_id + 1), max(self.max_actions, len(actions)))
+        self.index[key] = info_id
+        self.keys.append(key)
+        self.actions.append(actions)
+        self.num_infosets += 1
+        self.player[info_id] = player
+        self.num_actions[info_id] = len(actions)
+        self.strategy[info_id, :len(actions)] = 1 / len(actions)
+        self.strategy_rows.append(self.strategy[info_id].tolist())
+        self.regret_delta.append([0.0] * self.max_actions)
+        self.reach_delta.append(0.0)
+        self._rows = {}
+        self._key_array = None
+        self.version += 1
+        return info_id
+
+    def _resize(self, capacity, max_actions):
+        def resized(array):
+            new_array = np.zeros((capacity,) + ((max_actions,) if array.ndim == 2 else ()), dtype=array.dtype)
+            new_array[tuple(slice(0, s) for s in array.shape)] = array
+            return new_array
+        self.player, self.num_actions, self.reach_sum = resized(self.player), resized(self.num_actions), resized(self.reach_sum)
+        self.regret, self.strategy_sum, self.strategy = resized(self.regret), resized(self.strategy_sum), resized(self.strategy)
+        if max_actions > self.max_actions:
+            for row in self.strategy_rows + self.regret_delta:
+                row.extend([0.0] * (max_actions - self.max_actions))
+        self.max_actions = max_actions
+
+    @property
+    def valid(self):
+        """
+        mask of the action slots that exist
+        """
+        return np.arange(self.max_actions)[None, :] < self.num_actions[:self.num_infosets, None]
+
+    @property
+    def uniform(self):
+        return self.valid / self.num_actions[:self.num_infosets, None]
+
+    def rows(self, players=None):
+        """
+        ids of the information sets of players (all but chance by default)
+        """
+        players = tuple(range(self.num_players)) if players is None else tuple(players)
+        if players not in self._rows:
+            self._rows[players] = np.flatnonzero(np.isin(self.player[:self.num_infosets], players))
+        return self._rows[players]
+
+    def apply_deltas(self):
+        """
+        add the regrets and reach accumulated in the list buffers during a traversal and reset them
+        the average strategy numerator uses the current strategy, so call this before regret matching
+        """
+        n = self.num_infosets
+        self.regret[:n] += np.array(self.regret_delta)
+        self.add_reach(np.array(self.reach_delta))
+        self.regret_delta = [[0.0] * self.max_actions for _ in range(n)]
+        self.reach_delta = [0.0] * n
+
+    def add_reach(self, reach):
+        """
+        reach[i]: sum of own reach probability of the nodes of infoset i in this iteration
+        """
+        n = self.num_infosets
+        self.strategy_sum[:n] += reach[:, None] * self.strategy[:n]
+        self.reach_sum[:n] += reach
+        self.version += 1
+
+    def discount(self, t, update_rule, rows):
+        positive_discount, negative_discount = update_rule.regret_discounts(t)
+        if positive_discount != 1 or negative_discount != 1:
+            self.regret[rows] *= np.where(self.regret[rows] > 0, positive_discount, negative_discount)
+        if update_rule.floor_regrets:
+            self.regret[rows] = np.maximum(self.regret[rows], 0)
+        average_discount = update_rule.average_discount(t)
+        if average_discount != 1:
+            self.strategy_sum[rows] *= average_discount
+            self.reach_sum[rows] *= average_discount
+            self.version += 1
+
+    def regret_matching(self, rows):
+        positive_regret = np.maximum(self.regret[rows], 0)
+        regret_sum = positive_regret.sum(axis=1, keepdims=True)
+        uniform = self.valid[rows] / self.num_actions[rows, None]
+        self.strategy[rows] = np.where(regret_sum > 0, positive_regret / np.where(regret_sum > 0, regret_sum, 1), uniform)
+
+    def update(self, t=1, update_rule=None, players=None):
+        """
+        end of an iteration: apply the buffered deltas, discount with update_rule and recompute the strategy of players
+        """
+        self.apply_deltas()
+        rows = self.rows(players)
+        self.discount(t, get_update_rule(update_rule), rows)
+        self.regret_matching(rows)
+        self.strategy_rows = self.strategy[:self.num_infosets].tolist()
+
+    def average_strategy(self):
+        """
+        chance rows and information sets never reached are uniform
+        """
+        n = self.num_infosets
+        reach_sum = self.reach_sum[:n, None]
+        average_strategy = np.where(reach_sum > 0, self.strategy_sum[:n] / np.where(reach_sum > 0, reach_sum, 1), self.uniform)
+        chance_rows = self.rows([-1])
+        average_strategy[chance_rows] = self.strategy[chance_rows]
+        return average_strategy
+
+    @property
+    def key_array(self):
+        """
+        repr of the keys, to check that a checkpoint belongs to the same game
+        """
+        if self._key_array is None:
+            self._key_array = np.array([repr(key) for key in self.keys])
+        return self._key_array
+
+    def state_dict(self):
+        """
+        arrays of a checkpoint, taken between iterations (when the delta buffers are empty)
+        the average strategy is strategy_sum / reach_sum
+        """
+        n = self.num_infosets
+        return {
+            "infoset_keys": self.key_array,
+            "regret": self.regret[:n],
+            "strategy_sum": self.strategy_sum[:n],
+            "reach_sum": self.reach_sum[:n],
+            "strategy": self.strategy[:n],
+        }
+
+    def load_state_dict(self, state: dict):
+        if not np.array_equal(state["infoset_keys"], self.key_array):
+            raise ValueError("the checkpoint was taken on a different game")
+        n = self.num_infosets
+        self.regret[:n] = state["regret"]
+        self.strategy_sum[:n] = state["strategy_sum"]
+        self.reach_sum[:n] = state["reach_sum"]
+        self.strategy[:n] = state["strategy"]
+        self.strategy_rows = self.strategy[:n].tolist()
+        self.version += 1
+
+    def to_strategy_profile(self, strategy):
+        """
+        convert an (infoset, action slot) array into the nested strategy profile dict {player: {information: {action: p}}}
+        """
+        strategy_profile = {player: {} for player in range(-1, self.num_players)}
+        for (player, information), actions, p_dist in zip(self.keys, self.actions, strategy.tolist()):
+            strategy_profile[player][information] = dict(zip(actions, p_dist))
+        return strategy_profile
+
+    def strategy_profile(self):
+        return self.to_strategy_profile(self.strategy[:self.num_infosets])
+
+    def average_strategy_profile(self):
+        """
+        computed on demand and cached until the sums change, so training loops that do not evaluate never pay for it
+        the returned dict is shared by the callers until then, do not modify it
+        """
+        if self._average_strategy_profile is None or self._average_strategy_profile[0] != self.version:
+            self._average_strategy_profile = (self.version, self.to_strategy_profile(self.average_strategy()))
+        return self._average_strategy_profile[1]
+
+
+class TableSolver:
+    """
+    checkpointing and strategy profiles of the solvers that keep their regrets and strategy sums in an InfosetTable
+    (self.table) and count their iterations in self.t
+    """
+    def state_dict(self):
+        state = self.table.state_dict()
+        state.update({"solver": np.array(type(self).__name__), "t": np.array(self.t)})
+        return state
+
+    def load_state_dict(self, state: dict):
+        check_solver(state, type(self).__name__)
+        self.table.load_state_dict(state)
+        self.t = int(state["t"])
+
+    def strategy_profile(self):
+        return self.table.strategy_profile()
+
+    def average_strategy_profile(self):
+        return self.table.average_strategy_profile()
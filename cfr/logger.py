@@ -6,6 +6,11 @@ import json
 import time
 import datetime
 import tempfile
+import atexit
+import queue
+import threading
+import socket
+import struct
 from collections import defaultdict
 from contextlib import contextmanager
 
@@ -20,10 +25,16 @@ class KVWriter(object):
     def writekvs(self, kvs):
         raise NotImplementedError
 
+    def flush(self):
+        pass
+
 class SeqWriter(object):
     def writeseq(self, seq):
         raise NotImplementedError
 
+    def flush(self):
+        pass
+
 class HumanOutputFormat(KVWriter, SeqWriter):
     def __init__(self, filename_or_file):
         if isinstance(filename_or_file, str):
@@ -65,9 +76,6 @@ class HumanOutputFormat(KVWriter, SeqWriter):
         lines.append(dashes)
         self.file.write('\n'.join(lines) + '\n')
 
-        # Flush the output to the file
-        self.file.flush()
-
     def _truncate(self, s):
         maxlen = 30
         return s[:maxlen-3] + '...' if len(s) > maxlen else s
@@ -79,6 +87,8 @@ class HumanOutputFormat(KVWriter, SeqWriter):
             if i < len(seq) - 1: # add space unless this is the last one
                 self.file.write(' ')
         self.file.write('\n')
+
+    def flush(self):
         self.file.flush()
 
     def close(self):
@@ -95,35 +105,31 @@ class JSONOutputFormat(KVWriter):
                 v = v.tolist()
                 kvs[k] = float(v)
         self.file.write(json.dumps(kvs) + '\n')
+
+    def flush(self):
         self.file.flush()
 
     def close(self):
         self.file.close()
 
 class CSVOutputFormat(KVWriter):
+    """
+    The first line is the header. When a row has new keys, they are appended to the columns and the new header is
+    written as a '#' line, so the rows above are never rewritten: every row is a prefix of the columns of the last
+    header before it. read_csv reads the columns from the last header line.
+    """
     def __init__(self, filename):
-        self.file = open(filename, 'w+t')
+        self.file = open(filename, 'wt')
         self.keys = []
         self.sep = ','
 
     def writekvs(self, kvs):
-        # Add our current row to the history
         extra_keys = list(kvs.keys() - self.keys)
         extra_keys.sort()
         if extra_keys:
+            self.file.write('#' if self.keys else '')
             self.keys.extend(extra_keys)
-            self.file.seek(0)
-            lines = self.file.readlines()
-            self.file.seek(0)
-            for (i, k) in enumerate(self.keys):
-                if i > 0:
-                    self.file.write(',')
-                self.file.write(k)
-            self.file.write('\n')
-            for line in lines[1:]:
-                self.file.write(line[:-1])
-                self.file.write(self.sep * len(extra_keys))
-                self.file.write('\n')
+            self.file.write(self.sep.join(self.keys) + '\n')
         for (i, k) in enumerate(self.keys):
             if i > 0:
                 self.file.write(',')
@@ -131,15 +137,144 @@ class CSVOutputFormat(KVWriter):
             if v is not None:
                 self.file.write(str(v))
         self.file.write('\n')
+
+    def flush(self):
         self.file.flush()
 
     def close(self):
         self.file.close()
 
 
+# TensorBoard event files, written and read without tensorflow:
+# a file is a sequence of TFRecords (uint64 length, uint32 masked crc32c of the length, data, uint32 masked crc32c of
+# the data), each holding a serialized tensorflow.Event protobuf with the scalars in Summary.Value.simple_value
+
+def _make_crc32c_table():
+    table = []
+    for i in range(256):
+        crc = i
+        for _ in range(8):
+            crc = (crc >> 1) ^ 0x82F63B78 if crc & 1 else crc >> 1
+        table.append(crc)
+    return table
+
+_CRC32C_TABLE = _make_crc32c_table()
+
+def crc32c(data):
+    crc = 0xFFFFFFFF
+    table = _CRC32C_TABLE
+    for byte in data:
+        crc = table[(crc ^ byte) & 0xFF] ^ (crc >> 8)
+    return crc ^ 0xFFFFFFFF
+
+def _masked_crc32c(data):
+    crc = crc32c(data)
+    return (((crc >> 15) | (crc << 17)) + 0xA282EAD8) & 0xFFFFFFFF
+
+def _tfrecord(data):
+    header = struct.pack('<Q', len(data))
+    return header + struct.pack('<I', _masked_crc32c(header)) + data + struct.pack('<I', _masked_crc32c(data))
+
+def _varint(n):
+    out = bytearray()
+    while True:
+        byte = n & 0x7F
+        n >>= 7
+        if n:
+            out.append(byte | 0x80)
+        else:
+            out.append(byte)
+            return bytes(out)
+
+def _length_delimited(field, data):
+    return _varint(field << 3 | 2) + _varint(len(data)) + data
+
+def _encode_event(wall_time, step=0, file_version=None, scalars=()):
+    """
+    Event {double wall_time = 1; int64 step = 2; string file_version = 3; Summary summary = 5;}
+    Summary {repeated Value value = 1;}, Value {string tag = 1; float simple_value = 2;}
+    """
+    event = b'\x09' + struct.pack('<d', wall_time)
+    if step:
+        event += b'\x10' + _varint(step)
+    if file_version is not None:
+        event += _length_delimited(3, file_version.encode())
+    if scalars:
+        summary = b''.join(_length_delimited(1, _length_delimited(1, tag.encode()) + b'\x15' + struct.pack('<f', value))
+                           for tag, value in scalars)
+        event += _length_delimited(5, summary)
+    return event
+
+def _read_varint(data, pos):
+    n = shift = 0
+    while True:
+        byte = data[pos]
+        pos += 1
+        n |= (byte & 0x7F) << shift
+        shift += 7
+        if not byte & 0x80:
+            return n, pos
+
+def _parse_fields(data):
+    """
+    (field number, wire type, value) of a serialized protobuf message, values of length-delimited fields as bytes
+    """
+    pos = 0
+    while pos < len(data):
+        key, pos = _read_varint(data, pos)
+        field, wire_type = key >> 3, key & 7
+        if wire_type == 0:
+            value, pos = _read_varint(data, pos)
+        elif wire_type == 1:
+            value, pos = data[pos:pos + 8], pos + 8
+        elif wire_type == 2:
+            length, pos = _read_varint(data, pos)
+            value, pos = data[pos:pos + length], pos + length
+        elif wire_type == 5:
+            value, pos = data[pos:pos + 4], pos + 4
+        else:
+            raise ValueError('unsupported protobuf wire type %d' % wire_type)
+        yield field, wire_type, value
+
+def read_events(fname):
+    """
+    Yields (wall_time, step, {tag: simple_value}) of the events of a TensorBoard event file
+    """
+    with open(fname, 'rb') as fh:
+        while True:
+            header = fh.read(12)
+            if len(header) < 12:
+                return
+            length, = struct.unpack('<Q', header[:8])
+            data = fh.read(length)
+            footer = fh.read(4)
+            if len(data) < length or len(footer) < 4:
+                return  # truncated by a writer that is still running
+            if (struct.unpack('<I', header[8:])[0] != _masked_crc32c(header[:8])
+                    or struct.unpack('<I', footer)[0] != _masked_crc32c(data)):
+                raise ValueError('corrupted record in %s' % fname)
+            wall_time, step, scalars = 0.0, 0, {}
+            for field, _, value in _parse_fields(data):
+                if field == 1:
+                    wall_time, = struct.unpack('<d', value)
+                elif field == 2:
+                    step = value
+                elif field == 5:
+                    for _, _, summary_value in _parse_fields(value):
+                        tag, simple_value = None, None
+                        for value_field, _, x in _parse_fields(summary_value):
+                            if value_field == 1:
+                                tag = x.decode()
+                            elif value_field == 2:
+                                simple_value, = struct.unpack('<f', x)
+                        if tag is not None and simple_value is not None:
+                            scalars[tag] = simple_value
+            yield wall_time, step, scalars
+
 class TensorBoardOutputFormat(KVWriter):
     """
     Dumps key/value pairs into TensorBoard's numeric format.
+    The records are buffered in the file and written on flush().
     """
     def __init__(self, dir):
         os.makedirs(dir, exist_ok=True)
@@ -147,30 +282,100 @@ class TensorBoardOutputFormat(KVWriter):
         self.step = 1
         prefix = 'events'
         path = osp.join(osp.abspath(dir), prefix)
-        import tensorflow as tf
-        from tensorflow.python import pywrap_tensorflow
-        from tensorflow.core.util import event_pb2
-        from tensorflow.python.util import compat
-        self.tf = tf
-        self.event_pb2 = event_pb2
-        self.pywrap_tensorflow = pywrap_tensorflow
-        self.writer = pywrap_tensorflow.EventsWriter(compat.as_bytes(path))
+        now = time.time()
+        self.file = open('%s.out.tfevents.%010d.%s' % (path, now, socket.gethostname()), 'wb')
+        self.file.write(_tfrecord(_encode_event(now, file_version='brain.Event:2')))
 
     def writekvs(self, kvs):
-        def summary_val(k, v):
-            kwargs = {'tag': k, 'simple_value': float(v)}
-            return self.tf.Summary.Value(**kwargs)
-        summary = self.tf.Summary(value=[summary_val(k, v) for k, v in kvs.items()])
-        event = self.event_pb2.Event(wall_time=time.time(), summary=summary)
-        event.step = self.step # is there any reason why you'd want to specify the step?
-        self.writer.WriteEvent(event)
-        self.writer.Flush()
+        event = _encode_event(time.time(), self.step, scalars=[(k, float(v)) for k, v in kvs.items()])
+        self.file.write(_tfrecord(event))
         self.step += 1
 
+    def flush(self):
+        self.file.flush()
+
     def close(self):
-        if self.writer:
-            self.writer.Close()
-            self.writer = None
+        if self.file:
+            self.file.close()
+            self.file = None
+
+class WriterThread(object):
+    """
+    Writes the rows and messages of a Logger from a background thread, so that dumpkvs does not wait for the files.
+    The output formats are flushed every flush_interval seconds, and on flush() and close(). At most max_queue items
+    wait in the queue; a full queue blocks the caller.
+    """
+    def __init__(self, output_formats, flush_interval=1.0, max_queue=10000):
+        self.output_formats = output_formats
+        self.flush_interval = flush_interval
+        self.queue = queue.Queue(maxsize=max_queue)
+        self.error = None
+        self.thread = threading.Thread(target=self._run, name='logger-writer', daemon=True)
+        self.thread.start()
+        atexit.register(self.close)
+
+    def _put(self, item):
+        if self.error is not None:
+            error, self.error = self.error, None
+            raise RuntimeError('the logger writer thread failed') from error
+        self.queue.put(item)
+
+    def writekvs(self, kvs):
+        self._put(('kvs', kvs))
+
+    def writeseq(self, seq):
+        self._put(('seq', list(seq)))
+
+    def flush(self):
+        """
+        Block until everything queued so far is written and flushed.
+        """
+        self._put(('flush', None))
+        self.queue.join()
+
+    def close(self):
+        if self.thread is None:
+            return
+        self._put(('close', None))
+        self.thread.join()
+        self.thread = None
+        atexit.unregister(self.close)
+
+    def _run(self):
+        last_flush = time.time()
+        dirty = False  # written since the last flush
+        while True:
+            timeout = max(last_flush + self.flush_interval - time.time(), 0) if dirty else None
+            try:
+                kind, value = self.queue.get(timeout=timeout)
+            except queue.Empty:
+                kind, value = None, None
+            try:
+                if kind == 'kvs':
+                    for fmt in self.output_formats:
+                        if isinstance(fmt, KVWriter):
+                            fmt.writekvs(value)
+                    dirty = True
+                elif kind == 'seq':
+                    for fmt in self.output_formats:
+                        if isinstance(fmt, SeqWriter):
+                            fmt.writeseq(value)
+                    dirty = True
+                if dirty and (kind != 'kvs' and kind != 'seq' or time.time() - last_flush >= self.flush_interval):
+                    for fmt in self.output_formats:
+                        fmt.flush()
+                    dirty = False
+                    last_flush = time.time()
+                if kind == 'close':
+                    for fmt in self.output_formats:
+                        fmt.close()
+            except Exception as e:
+                self.error = e
+            finally:
+                if kind is not None:
+                    self.queue.task_done()
+            if kind == 'close':
+                return
 
 def make_output_format(format, ev_dir, log_suffix=''):
     os.makedirs(ev_dir, exist_ok=True)
@@ -218,6 +423,12 @@ def dumpkvs():
     """
     return get_current().dumpkvs()
 
+def flush():
+    """
+    Wait until the dumped rows are written to the output files
+    """
+    get_current().flush()
+
 def getkvs():
     return get_current().name2val
 
@@ -299,13 +510,15 @@ class Logger(object):
                     # So that you can still log to the terminal without setting up any output files
     CURRENT = None  # Current logger being used by the free functions above
 
-    def __init__(self, dir, output_formats, comm=None):
+    def __init__(self, dir, output_formats, comm=None, flush_interval=None):
         self.name2val = defaultdict(float)  # values this iteration
         self.name2cnt = defaultdict(int)
         self.level = INFO
         self.dir = dir
         self.output_formats = output_formats
         self.comm = comm
+        # with a flush_interval, the output formats are written by a WriterThread, otherwise every dump is flushed
+        self.writer = WriterThread(output_formats, flush_interval) if flush_interval is not None else None
 
     # Logging API, forwarded
     # ----------------------------------------
@@ -328,9 +541,13 @@ class Logger(object):
             if self.comm.rank != 0:
                 d['dummy'] = 1 # so we don't get a warning about empty dict
         out = d.copy() # Return the dict for unit testing purposes
-        for fmt in self.output_formats:
-            if isinstance(fmt, KVWriter):
-                fmt.writekvs(d)
+        if self.writer is not None:
+            self.writer.writekvs(d.copy())
+        else:
+            for fmt in self.output_formats:
+                if isinstance(fmt, KVWriter):
+                    fmt.writekvs(d)
+                    fmt.flush()
         self.name2val.clear()
         self.name2cnt.clear()
         return out
@@ -350,16 +567,27 @@ class Logger(object):
     def get_dir(self):
         return self.dir
 
+    def flush(self):
+        if self.writer is not None:
+            self.writer.flush()
+
     def close(self):
+        if self.writer is not None:
+            self.writer.close()
+            return
         for fmt in self.output_formats:
             fmt.close()
 
     # Misc
     # ----------------------------------------
     def _do_log(self, args):
+        if self.writer is not None:
+            self.writer.writeseq(map(str, args))
+            return
         for fmt in self.output_formats:
             if isinstance(fmt, SeqWriter):
                 fmt.writeseq(map(str, args))
+                fmt.flush()
 
 def get_rank_without_mpi_import():
     # check environment variables here instead of importing mpi4py
@@ -369,9 +597,11 @@ def get_rank_without_mpi_import():
             return int(os.environ[varname])
     return 0
 
-def configure(dir=None, format_strs=None, comm=None, log_suffix=''):
+def configure(dir=None, format_strs=None, comm=None, log_suffix='', flush_interval=1.0):
     """
     If comm is provided, average all numerical stats across that comm
+    The files are written by a background thread and flushed every flush_interval seconds, and on flush() and close().
+    With flush_interval=None, they are written and flushed by every dumpkvs.
     """
     if dir is None:
         dir = os.getenv('OPENAI_LOGDIR')
@@ -394,7 +624,7 @@ def configure(dir=None, format_strs=None, comm=None, log_suffix=''):
     format_strs = filter(None, format_strs)
     output_formats = [make_output_format(f, dir, log_suffix) for f in format_strs]
 
-    Logger.CURRENT = Logger(dir=dir, output_formats=output_formats, comm=comm)
+    Logger.CURRENT = Logger(dir=dir, output_formats=output_formats, comm=comm, flush_interval=flush_interval)
     log('Logging to %s'%dir)
 
 def _configure_default_logger():
@@ -408,9 +638,9 @@ def reset():
         log('Reset logger')
 
 @contextmanager
-def scoped_configure(dir=None, format_strs=None, comm=None):
+def scoped_configure(dir=None, format_strs=None, comm=None, flush_interval=1.0):
     prevlogger = Logger.CURRENT
-    configure(dir=dir, format_strs=format_strs, comm=comm)
+    configure(dir=dir, format_strs=format_strs, comm=comm, flush_interval=flush_interval)
     try:
         yield
     finally:
@@ -461,8 +691,16 @@ def read_json(fname):
     return pandas.DataFrame(ds)
 
 def read_csv(fname):
+    """
+    the columns are those of the last header, see CSVOutputFormat
+    """
     import pandas
-    return pandas.read_csv(fname, index_col=None, comment='#')
+    with open(fname, 'rt') as fh:
+        header = fh.readline()
+        for line in fh:
+            if line.startswith('#'):
+                header = line[1:]
+    return pandas.read_csv(fname, index_col=None, comment='#', header=0, names=header.rstrip('\n').split(','))
 
 def read_tb(path):
     """
@@ -472,7 +710,6 @@ def read_tb(path):
     import pandas
     import numpy as np
     from glob import glob
-    import tensorflow as tf
     if osp.isdir(path):
         fnames = glob(osp.join(path, "events.*"))
     elif osp.basename(path).startswith("events."):
@@ -482,12 +719,11 @@ def read_tb(path):
     tag2pairs = defaultdict(list)
     maxstep = 0
     for fname in fnames:
-        for summary in tf.train.summary_iterator(fname):
-            if summary.step > 0:
-                for v in summary.summary.value:
-                    pair = (summary.step, v.simple_value)
-                    tag2pairs[v.tag].append(pair)
-                maxstep = max(summary.step, maxstep)
+        for (_, step, scalars) in read_events(fname):
+            if step > 0:
+                for (tag, value) in scalars.items():
+                    tag2pairs[tag].append((step, value))
+                maxstep = max(step, maxstep)
     data = np.empty((maxstep, len(tag2pairs)))
     data[:] = np.nan
     tags = sorted(tag2pairs.keys())
@@ -0,0 +1,255 @@
+"""
+Monte Carlo CFR on the Node tree
+Monte Carlo Sampling for Regret Minimization in Extensive Games, M. Lanctot, K. Waugh, M. Zinkevich, M. Bowling. NIPS 2009.
+
+regrets and average strategy numerators are kept per information set, {player: {information: {action: value}}},
+and are only created for the information sets the sampled trajectories reach
+"""
+import ast
+import random
+
+import numpy as np
+
+import profiling
+from checkpoint import check_solver, rng_state, set_rng_state
+from envs.game import Node
+
+
+def regret_matching(regrets: dict):
+    positive_regret_sum = sum(max(regret, 0) for regret in regrets.values())
+    if positive_regret_sum > 0:
+        return {action: max(regret, 0) / positive_regret_sum for action, regret in regrets.items()}
+    return {action: 1 / len(regrets) for action in regrets}
+
+
+class MCCFR:
+    def __init__(self, game, seed=None):
+        self.game = game
+        self.num_players = game.num_players
+        self.rng = random.Random(seed)
+        self.regret_sum = {player: {} for player in range(game.num_players)}
+        self.strategy_sum = {player: {} for player in range(game.num_players)}
+        self.t = 0  # number of iterations done
+        self.num_visited = 0  # nodes visited in the last iteration
+        self.num_updated = 0  # regret updates of information sets in the last iteration
+        self._average_strategy_profile = None  # (t, profile)
+
+    def iteration(self):
+        raise NotImplementedError
+
+    def current_strategy(self, node: Node):
+        regrets = self.regret_sum[node.player].get(node.information)
+        if regrets is None:
+            actions = node.actions()
+            regrets = self.regret_sum[node.player][node.information] = {action: 0 for action in actions}
+            self.strategy_sum[node.player][node.information] = {action: 0 for action in actions}
+        return regret_matching(regrets)
+
+    def sample_chance(self, node: Node):
+        """
+        chance outcomes are uniform, as in the chance rows of infoset_table.InfosetTable
+        on a lazy game, only the sampled child is generated
+        """
+        actions = node.actions()
+        return node.child(actions[self.rng.randrange(len(actions))])
+
+    def sample_action(self, p_dist: dict):
+        r = self.rng.random()
+        cumulative = 0
+        for action, p in p_dist.items():
+            cumulative += p
+            if r < cumulative:
+                return action
+        return action  # rounding error
+
+    def state_dict(self):
+        """
+        the tables as arrays padded to the largest number of actions, the key of row i being
+        repr((player, information, actions)) in infoset_keys[i]
+        """
+        keys, regrets, sums = [], [], []
+        for player in range(self.num_players):
+            for information, regret in self.regret_sum[player].items():
+                keys.append(repr((player, information, tuple(regret))))
+                regrets.append(list(regret.values()))
+                sums.append(list(self.strategy_sum[player][information].values()))
+        max_actions = max((len(regret) for regret in regrets), default=0)
+        state = {
+            "solver": np.array(type(self).__name__),
+            "t": np.array(self.t),
+            "infoset_keys": np.array(keys, dtype=str),
+            "regret_sum": np.array([row + [0.0] * (max_actions - len(row)) for row in regrets]).reshape(-1, max_actions),
+            "strategy_sum": np.array([row + [0.0] * (max_actions - len(row)) for row in sums]).reshape(-1, max_actions),
+        }
+        state.update(rng_state(self.rng))
+        return state
+
+    def load_state_dict(self, state: dict):
+        check_solver(state, type(self).__name__)
+        self.regret_sum = {player: {} for player in range(self.num_players)}
+        self.strategy_sum = {player: {} for player in range(self.num_players)}
+        for key, regrets, sums in zip(state["infoset_keys"], state["regret_sum"].tolist(), state["strategy_sum"].tolist()):
+            player, information, actions = ast.literal_eval(str(key))
+            self.regret_sum[player][information] = dict(zip(actions, regrets))
+            self.strategy_sum[player][information] = dict(zip(actions, sums))
+        self.t = int(state["t"])
+        set_rng_state(self.rng, state)
+        self._average_strategy_profile = None
+
+    def average_strategy_profile(self):
+        """
+        information sets that have never been sampled are played uniformly
+        on a lazy game, the information sets whose nodes have not been expanded are left out
+        cached until the next iteration, do not modify the returned dict
+        """
+        if self._average_strategy_profile is not None and self._average_strategy_profile[0] == self.t:
+            return self._average_strategy_profile[1]
+        strategy_profile = {player: {} for player in range(-1, self.num_players)}
+        for player, information_nodes in self.game.information_sets.items():
+            for information, nodes in information_nodes.items():
+                if not nodes[0].terminal and getattr(nodes[0], "expanded", True):
+                    strategy_profile[player][information] = {action: 1 / len(nodes[0].children) for action in nodes[0].children}
+        for player, information_sums in self.strategy_sum.items():
+            for information, sums in information_sums.items():
+                total = sum(sums.values())
+                if total > 0:
+                    strategy_profile[player][information] = {action: s / total for action, s in sums.items()}
+        self._average_strategy_profile = (self.t, strategy_profile)
+        return strategy_profile
+
+
+class ChanceSamplingCFR(MCCFR):
+    """
+    samples one outcome at every chance node and traverses every action of the players
+    the sampled counterfactual value is the chance-free value, pi_c / q_c = 1
+    """
+    def iteration(self):
+        self.num_visited = self.num_updated = 0
+        with profiling.phase("traverse"):
+            self._traverse(self.game.root, [1.0 for _ in range(self.num_players)])
+        self.t += 1
+
+    def _traverse(self, node: Node, reach: list):
+        self.num_visited += 1
+        if node.terminal:
+            return node.eu
+        if node.player == -1:
+            return self._traverse(self.sample_chance(node), reach)
+        strategy = self.current_strategy(node)
+        player_reach = reach[node.player]
+        action_values = {}
+        node_value = 0
+        for action, child_node in node.children.items():
+            reach[node.player] = player_reach * strategy[action]
+            action_values[action] = self._traverse(child_node, reach)
+            node_value += strategy[action] * action_values[action]
+        reach[node.player] = player_reach
+
+        counterfactual_reach = 1
+        for player in range(self.num_players):
+            if player != node.player:
+                counterfactual_reach *= reach[player]
+        sign = 1 if node.player == 0 else -1  # utilities are stored from player 0's point of view
+        regrets = self.regret_sum[node.player][node.information]
+        self.num_updated += 1
+        sums = self.strategy_sum[node.player][node.information]
+        for action in node.children:
+            regrets[action] += sign * counterfactual_reach * (action_values[action] - node_value)
+            sums[action] += player_reach * strategy[action]
+        return node_value
+
+
+class ExternalSamplingCFR(MCCFR):
+    """
+    for each traverser, samples chance and opponent actions and traverses every action of the traverser
+    the opponent's average strategy is updated where its actions are sampled (simple averaging)
+    """
+    def iteration(self):
+        self.num_visited = self.num_updated = 0
+        with profiling.phase("traverse"):
+            for traverser in range(self.num_players):
+                self._traverse(self.game.root, traverser)
+        self.t += 1
+
+    def _traverse(self, node: Node, traverser: int):
+        self.num_visited += 1
+        if node.terminal:
+            return node.eu if traverser == 0 else -node.eu
+        if node.player == -1:
+            return self._traverse(self.sample_chance(node), traverser)
+        strategy = self.current_strategy(node)
+        if node.player != traverser:
+            sums = self.strategy_sum[node.player][node.information]
+            for action, p in strategy.items():
+                sums[action] += p
+            return self._traverse(node.child(self.sample_action(strategy)), traverser)
+
+        action_values = {action: self._traverse(child_node, traverser) for action, child_node in node.children.items()}
+        node_value = sum(strategy[action] * value for action, value in action_values.items())
+        regrets = self.regret_sum[node.player][node.information]
+        self.num_updated += 1
+        for action, value in action_values.items():
+            regrets[action] += value - node_value
+        return node_value
+
+
+class OutcomeSamplingCFR(MCCFR):
+    """
+    for each traverser, samples a single terminal history, exploring the traverser's actions with probability epsilon
+    regrets are importance weighted by the sampling probability of the history, and the opponent's average strategy
+    is updated with stochastically-weighted averaging
+    """
+    def __init__(self, game, seed=None, epsilon=0.6):
+        super().__init__(game, seed)
+        self.epsilon = epsilon
+
+    def iteration(self):
+        self.num_visited = self.num_updated = 0
+        with profiling.phase("traverse"):
+            for traverser in range(self.num_players):
+                self._traverse(self.game.root, traverser, 1.0, 1.0)
+        self.t += 1
+
+    def _traverse(self, node: Node, traverser: int, opponent_reach, sample_reach):
+        """
+        returns the importance weighted estimate of the traverser's expected utility at node
+        opponent_reach contains chance
+        """
+        self.num_visited += 1
+        if node.terminal:
+            return node.eu if traverser == 0 else -node.eu
+        if node.player == -1:
+            p = 1 / len(node.actions())
+            return self._traverse(self.sample_chance(node), traverser, opponent_reach * p, sample_reach * p)
+        strategy = self.current_strategy(node)
+        if node.player == traverser:
+            sampling_policy = {action: self.epsilon / len(strategy) + (1 - self.epsilon) * p for action, p in strategy.items()}
+        else:
+            sampling_policy = strategy
+        sampled_action = self.sample_action(sampling_policy)
+        p = strategy[sampled_action]
+        q = sampling_policy[sampled_action]
+
+        if node.player == traverser:
+            child_value = self._traverse(node.child(sampled_action), traverser, opponent_reach, sample_reach * q)
+            sampled_action_value = child_value / q  # estimated values of the actions not sampled are 0
+            node_value = p * sampled_action_value
+            weight = opponent_reach / sample_reach
+            regrets = self.regret_sum[node.player][node.information]
+            self.num_updated += 1
+            for action in strategy:
+                action_value = sampled_action_value if action == sampled_action else 0
+                regrets[action] += weight * (action_value - node_value)
+            return node_value
+        child_value = self._traverse(node.child(sampled_action), traverser, opponent_reach * p, sample_reach * q)
+        sums = self.strategy_sum[node.player][node.information]
+        for action, action_p in strategy.items():
+            sums[action] += action_p * opponent_reach / sample_reach
+        return child_value  # p == q
+
+
+MCCFR_SOLVERS = {
+    "chance": ChanceSamplingCFR,
+    "external": ExternalSamplingCFR,
+    "outcome": OutcomeSamplingCFR,
+}
@@ -0,0 +1,133 @@
+"""
+CFR with the subtrees of the root chance node (e.g. the card deals) partitioned across worker processes
+
+every traversal, the workers read the current strategy from a shared memory array, traverse their subtrees with
+cfr.traverse_tree, and write the regret and reach deltas they accumulated into their own slice of shared memory arrays,
+which the main process sums into the InfosetTable before discounting and regret matching
+"""
+import multiprocessing
+from multiprocessing import shared_memory
+
+import numpy as np
+
+import profiling
+from infoset_table import InfosetTable, TableSolver
+from pruning import set_subtree_sizes
+from update_rules import get_update_rule
+
+
+def _attach(name, shape):
+    memory = shared_memory.SharedMemory(name=name)
+    return memory, np.ndarray(shape, dtype=np.float64, buffer=memory.buf)
+
+
+def _worker(game, worker_id, subtree_ids, memory_names, shape, conn):
+    from cfr import traverse_tree  # cfr imports this module
+
+    num_workers, num_infosets, max_actions = shape
+    table = InfosetTable.from_tree(game.root, game.num_players)
+    strategy_memory, strategy = _attach(memory_names[0], (num_infosets, max_actions))
+    regret_memory, regret_delta = _attach(memory_names[1], (num_workers, num_infosets, max_actions))
+    reach_memory, reach_delta = _attach(memory_names[2], (num_workers, num_infosets))
+    root_reach = [1.0] * game.num_players + [1 / len(game.root.child_nodes)]
+    subtrees = [game.root.child_nodes[i] for i in subtree_ids]
+    while True:
+        traverser = conn.recv()
+        if traverser == "close":
+            break
+        table.strategy_rows = strategy.tolist()
+        table.regret_delta = [[0.0] * max_actions for _ in range(num_infosets)]
+        table.reach_delta = [0.0] * num_infosets
+        num_visited = 0
+        for subtree in subtrees:
+            num_visited += traverse_tree(subtree, table, traverser, root_reach=root_reach)
+        regret_delta[worker_id] = table.regret_delta
+        reach_delta[worker_id] = table.reach_delta
+        conn.send(num_visited)
+    del strategy, regret_delta, reach_delta
+    for memory in (strategy_memory, regret_memory, reach_memory):
+        memory.close()
+
+
+class ParallelCFR(TableSolver):
+    """
+    num_workers processes share the subtrees of the root chance node, balanced by their number of nodes
+    the updates are those of the serial traverse_tree loop (up to the order of floating point sums)
+    call close() to stop the workers and free the shared memory
+    """
+    def __init__(self, game, num_workers, update_rule=None, alternating=False):
+        if game.root.player != -1:
+            raise ValueError("the root of the game must be a chance node")
+        self.game = game
+        self.update_rule = get_update_rule(update_rule)
+        self.alternating = alternating
+        self.t = 0  # number of iterations done
+        self.table = InfosetTable.from_tree(game.root, game.num_players)
+        self.num_visited = 0  # nodes visited by the workers in the last iteration
+        self.num_updated = 0  # information sets updated in the last iteration
+
+        set_subtree_sizes(game.root)
+        num_workers = min(num_workers, len(game.root.child_nodes))
+        loads = [0] * num_workers
+        subtree_ids = [[] for _ in range(num_workers)]
+        for i in sorted(range(len(game.root.child_nodes)), key=lambda i: -game.root.child_nodes[i].subtree_size):
+            worker_id = loads.index(min(loads))
+            subtree_ids[worker_id].append(i)
+            loads[worker_id] += game.root.child_nodes[i].subtree_size
+
+        n, max_actions = self.table.num_infosets, self.table.max_actions
+        self.memories = [shared_memory.SharedMemory(create=True, size=max(8 * size, 1))
+                         for size in (n * max_actions, num_workers * n * max_actions, num_workers * n)]
+        self.strategy = np.ndarray((n, max_actions), dtype=np.float64, buffer=self.memories[0].buf)
+        self.regret_delta = np.ndarray((num_workers, n, max_actions), dtype=np.float64, buffer=self.memories[1].buf)
+        self.reach_delta = np.ndarray((num_workers, n), dtype=np.float64, buffer=self.memories[2].buf)
+        names = [memory.name for memory in self.memories]
+        self.connections, self.workers = [], []
+        for worker_id in range(num_workers):
+            conn, worker_conn = multiprocessing.Pipe()
+            worker = multiprocessing.Process(target=_worker, args=(game, worker_id, subtree_ids[worker_id], names,
+                                                                   (num_workers, n, max_actions), worker_conn),
+                                             daemon=True)
+            worker.start()
+            self.connections.append(conn)
+            self.workers.append(worker)
+
+    def iteration(self):
+        self.t += 1
+        groups = [[player] for player in range(self.game.num_players)] if self.alternating else [None]
+        self.num_visited = self.num_updated = 0
+        for players in groups:
+            self._update(players)
+            self.num_updated += len(self.table.rows(players))
+
+    def _update(self, players):
+        table = self.table
+        n = table.num_infosets
+        traverser = None if players is None else players[0]
+        with profiling.phase("traverse"):
+            self.strategy[:] = table.strategy[:n]
+            for conn in self.connections:
+                conn.send(traverser)
+            for conn in self.connections:
+                self.num_visited += conn.recv()
+        with profiling.phase("update"):
+            table.regret[:n] += self.regret_delta.sum(axis=0)
+            table.add_reach(self.reach_delta.sum(axis=0))
+            rows = table.rows(players)
+            table.discount(self.t, self.update_rule, rows)
+            table.regret_matching(rows)
+
+    def close(self):
+        for conn in self.connections:
+            try:
+                conn.send("close")
+            except BrokenPipeError:  # the worker failed
+                pass
+        for worker in self.workers:
+            worker.join()
+        self.connections, self.workers = [], []
+        del self.strategy, self.regret_delta, self.reach_delta
+        for memory in self.memories:
+            memory.close()
+            memory.unlink()
+        self.memories = []
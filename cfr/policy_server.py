@@ -0,0 +1,217 @@
+"""
+local server answering strategy queries from a policy_store.PolicyStore, so that bots share one loaded strategy
+
+protocol: one JSON object per line in each direction
+    {"id": 1, "op": "p_dist", "queries": [[player, information], ...]}  -> {"id": 1, "result": [{action: p} or null, ...]}
+    {"id": 2, "op": "sample", "queries": [[player, information], ...]}  -> {"id": 2, "result": [action or null, ...]}
+    {"id": 3, "op": "stats"}                                            -> {"id": 3, "result": {...}}
+information is sent as JSON lists, e.g. [[0], ["check", "bet"]] for ((0,), ("check", "bet"))
+
+queries of concurrent requests are coalesced: they are collected for batch_window seconds (or until max_batch of them
+are waiting) and looked up together, each distinct information set once, through an LRU cache
+"""
+import argparse
+import asyncio
+import json
+import random
+import socket
+import time
+from collections import OrderedDict, deque
+
+import numpy as np
+
+from policy_store import PolicyStore
+
+
+def to_tuple(x):
+    """
+    JSON lists back to the tuples of information set keys
+    """
+    return tuple(to_tuple(y) for y in x) if isinstance(x, list) else x
+
+
+class PolicyServer:
+    def __init__(self, store, cache_size=65536, batch_window=0.0005, max_batch=1024, seed=None, latency_window=10000):
+        self.store = store
+        self.cache = OrderedDict()  # (player, information) -> p_dist or None, most recently used last
+        self.cache_size = cache_size
+        self.batch_window = batch_window
+        self.max_batch = max_batch
+        self.rng = random.Random(seed)
+        self.pending = []  # [(keys, future)] waiting for the next batch
+        self.num_pending = 0
+        self.flush_handle = None
+        self.latencies = deque(maxlen=latency_window)  # seconds of the last requests
+        self.num_requests = 0
+        self.num_queries = 0
+        self.num_batches = 0
+        self.num_lookups = 0  # distinct queries of the batches
+        self.num_cache_hits = 0
+
+    def _p_dist(self, key):
+        if key in self.cache:
+            self.num_cache_hits += 1
+            self.cache.move_to_end(key)
+            return self.cache[key]
+        player, information = key
+        p_dist = self.store[player].get(information)
+        self.cache[key] = p_dist
+        if len(self.cache) > self.cache_size:
+            self.cache.popitem(last=False)
+        return p_dist
+
+    def lookup(self, keys):
+        """
+        future of the p_dists of keys, resolved with the next batch
+        """
+        future = asyncio.get_running_loop().create_future()
+        self.pending.append((keys, future))
+        self.num_pending += len(keys)
+        if self.num_pending >= self.max_batch:
+            self._flush()
+        elif self.flush_handle is None:
+            self.flush_handle = asyncio.get_running_loop().call_later(self.batch_window, self._flush)
+        return future
+
+    def _flush(self):
+        if self.flush_handle is not None:
+            self.flush_handle.cancel()
+            self.flush_handle = None
+        pending, self.pending, self.num_pending = self.pending, [], 0
+        results = {}
+        for keys, _ in pending:
+            for key in keys:
+                if key not in results:
+                    results[key] = self._p_dist(key)
+        self.num_batches += 1
+        self.num_lookups += len(results)
+        for keys, future in pending:
+            if not future.done():
+                future.set_result([results[key] for key in keys])
+
+    def sample(self, p_dist):
+        if p_dist is None:
+            return None
+        r = self.rng.random()
+        cumulative = 0
+        for action, p in p_dist.items():
+            cumulative += p
+            if r < cumulative:
+                return action
+        return action  # rounding error
+
+    def stats(self):
+        latencies = np.array(self.latencies) * 1000
+        percentiles = np.percentile(latencies, [50, 90, 99]).tolist() if len(latencies) else [None] * 3
+        return {
+            "requests": self.num_requests,
+            "queries": self.num_queries,
+            "batches": self.num_batches,
+            "lookups": self.num_lookups,
+            "cache_hits": self.num_cache_hits,
+            "cache_size": len(self.cache),
+            "latency_ms_p50": percentiles[0],
+            "latency_ms_p90": percentiles[1],
+            "latency_ms_p99": percentiles[2],
+        }
+
+    async def handle_request(self, request: dict):
+        op = request.get("op")
+        if op == "stats":
+            return self.stats()
+        if op not in ("p_dist", "sample"):
+            raise ValueError("unknown op %r" % op)
+        keys = [(player, to_tuple(information)) for player, information in request["queries"]]
+        self.num_queries += len(keys)
+        p_dists = await self.lookup(keys)
+        if op == "sample":
+            return [self.sample(p_dist) for p_dist in p_dists]
+        return p_dists
+
+    async def handle_connection(self, reader, writer):
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                start = time.perf_counter()
+                request = {}
+                try:
+                    request = json.loads(line)
+                    response = {"id": request.get("id"), "result": await self.handle_request(request)}
+                except Exception as e:  # reported to the client, the connection stays open
+                    response = {"id": request.get("id") if isinstance(request, dict) else None, "error": repr(e)}
+                writer.write(json.dumps(response).encode() + b"\n")
+                await writer.drain()
+                self.num_requests += 1
+                self.latencies.append(time.perf_counter() - start)
+        except ConnectionError:
+            pass
+        finally:
+            writer.close()
+
+    async def start(self, unix_socket=None, host="127.0.0.1", port=8765):
+        if unix_socket is not None:
+            return await asyncio.start_unix_server(self.handle_connection, path=unix_socket)
+        return await asyncio.start_server(self.handle_connection, host, port)
+
+    async def serve_forever(self, **kwargs):
+        server = await self.start(**kwargs)
+        async with server:
+            await server.serve_forever()
+
+
+class PolicyClient:
+    """
+    blocking client of a PolicyServer
+    """
+    def __init__(self, unix_socket=None, host="127.0.0.1", port=8765):
+        if unix_socket is not None:
+            self.socket = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            self.socket.connect(unix_socket)
+        else:
+            self.socket = socket.create_connection((host, port))
+        self.file = self.socket.makefile("rwb")
+        self.next_id = 0
+
+    def request(self, op, queries=None):
+        self.next_id += 1
+        request = {"id": self.next_id, "op": op}
+        if queries is not None:
+            request["queries"] = [[player, information] for player, information in queries]
+        self.file.write(json.dumps(request).encode() + b"\n")
+        self.file.flush()
+        response = json.loads(self.file.readline())
+        if "error" in response:
+            raise RuntimeError(response["error"])
+        return response["result"]
+
+    def p_dists(self, queries):
+        return self.request("p_dist", queries)
+
+    def sample(self, queries):
+        return self.request("sample", queries)
+
+    def stats(self):
+        return self.request("stats")
+
+    def close(self):
+        self.file.close()
+        self.socket.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="serve a policy store written by policy_store.write_policy_store")
+    parser.add_argument("policy", nargs="?", default="./logs/average_strategy.policy")
+    parser.add_argument("--unix-socket")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--cache-size", type=int, default=65536)
+    args = parser.parse_args()
+    with PolicyStore(args.policy) as store:
+        server = PolicyServer(store, cache_size=args.cache_size)
+        asyncio.run(server.serve_forever(unix_socket=args.unix_socket, host=args.host, port=args.port))
+
+
+if __name__ == "__main__":
+    main()
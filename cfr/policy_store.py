@@ -0,0 +1,202 @@
+"""
+read-optimized file format of a strategy profile, opened with mmap so that lookups deserialize nothing and every
+process opening the file shares the page cache
+
+layout (little endian, every section 8-byte aligned):
+    header          MAGIC, then int64 num_entries, table_size, max_actions, key_bytes, action_bytes
+    slot_hash       uint64[table_size]  blake2b hash of the key of the entry in the slot
+    slot_entry      int64[table_size]   entry of the slot, -1 if empty (open addressing with linear probing)
+    key_offsets     int64[num_entries + 1] offsets of the keys in the key blob
+    action_offsets  int64[num_entries + 1] offsets of the actions in the action blob
+    num_actions     int64[num_entries]
+    probabilities   float64[num_entries, max_actions]
+    key blob        utf-8 repr((player, information)) of every entry, compared on lookup to rule out hash collisions
+    action blob     utf-8 actions of every entry separated by \\0
+"""
+import hashlib
+import mmap
+
+import numpy as np
+
+from atomic_file import atomic_write
+
+MAGIC = b"CFRPOL01"
+HEADER_FIELDS = 5
+
+
+def encode_key(player, information):
+    return repr((player, information)).encode()
+
+
+def hash_key(key: bytes):
+    return int.from_bytes(hashlib.blake2b(key, digest_size=8).digest(), "little")
+
+
+def _aligned(size):
+    return (size + 7) // 8 * 8
+
+
+def write_policy_store(path, strategy_profile: dict):
+    """
+    write the information sets of the players (chance excluded) of strategy_profile {player: {information: {action: p}}}
+    written with atomic_file.atomic_write
+    """
+    keys, actions, p_dists = [], [], []
+    for player, sigma in strategy_profile.items():
+        if player == -1:
+            continue
+        for information, p_dist in sigma.items():
+            keys.append(encode_key(player, information))
+            actions.append("\0".join(p_dist).encode())
+            p_dists.append(list(p_dist.values()))
+    num_entries = len(keys)
+    table_size = 1
+    while table_size < 2 * num_entries:  # load factor <= 0.5
+        table_size *= 2
+    max_actions = max((len(p_dist) for p_dist in p_dists), default=0)
+
+    slot_hash = np.zeros(table_size, dtype=np.uint64)
+    slot_entry = np.full(table_size, -1, dtype=np.int64)
+    for entry, key in enumerate(keys):
+        h = hash_key(key)
+        slot = h & (table_size - 1)
+        while slot_entry[slot] >= 0:
+            slot = (slot + 1) & (table_size - 1)
+        slot_hash[slot] = h
+        slot_entry[slot] = entry
+    key_offsets = np.zeros(num_entries + 1, dtype=np.int64)
+    key_offsets[1:] = np.cumsum([len(key) for key in keys])
+    action_offsets = np.zeros(num_entries + 1, dtype=np.int64)
+    action_offsets[1:] = np.cumsum([len(a) for a in actions])
+    probabilities = np.zeros((num_entries, max_actions))
+    for entry, p_dist in enumerate(p_dists):
+        probabilities[entry, :len(p_dist)] = p_dist
+    key_blob, action_blob = b"".join(keys), b"".join(actions)
+
+    with atomic_write(path) as f:
+        f.write(MAGIC)
+        f.write(np.array([num_entries, table_size, max_actions, len(key_blob), len(action_blob)], dtype="<i8").tobytes())
+        for array in [slot_hash, slot_entry, key_offsets, action_offsets, np.array([len(p) for p in p_dists], dtype=np.int64),
+                      probabilities]:
+            f.write(array.astype(array.dtype.newbyteorder("<")).tobytes())
+        f.write(key_blob + b"\0" * (_aligned(len(key_blob)) - len(key_blob)))
+        f.write(action_blob)
+
+
+class PlayerPolicy:
+    """
+    strategy of one player in a PolicyStore, read like strategy_profile[player]
+    """
+    def __init__(self, store, player):
+        self.store = store
+        self.player = player
+
+    def __getitem__(self, information):
+        return self.store.p_dist(self.player, information)
+
+    def __contains__(self, information):
+        return self.store.find(self.player, information) >= 0
+
+    def get(self, information, default=None):
+        entry = self.store.find(self.player, information)
+        return default if entry < 0 else self.store.entry_p_dist(entry)
+
+
+class PolicyStore:
+    """
+    read-only strategy profile backed by a file written by write_policy_store
+    store[player][information] gives {action: p} like a strategy profile dict (information sets that are not stored,
+    e.g. chance, are missing), and probabilities() a view of the probabilities without building any Python object
+    """
+    def __init__(self, path):
+        self.file = open(path, "rb")
+        self.buffer = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+        if self.buffer[:len(MAGIC)] != MAGIC:
+            raise ValueError("%s is not a policy store" % path)
+        offset = len(MAGIC)
+        header = np.frombuffer(self.buffer, dtype="<i8", count=HEADER_FIELDS, offset=offset)
+        self.num_entries, self.table_size, self.max_actions, key_bytes, action_bytes = (int(x) for x in header)
+        offset += 8 * HEADER_FIELDS
+
+        def view(dtype, count):
+            nonlocal offset
+            array = np.frombuffer(self.buffer, dtype=dtype, count=count, offset=offset)
+            offset += array.nbytes
+            return array
+        self.slot_hash = view("<u8", self.table_size)
+        self.slot_entry = view("<i8", self.table_size)
+        self.key_offsets = view("<i8", self.num_entries + 1)
+        self.action_offsets = view("<i8", self.num_entries + 1)
+        self.num_actions = view("<i8", self.num_entries)
+        self.probabilities_array = view("<f8", self.num_entries * self.max_actions).reshape(self.num_entries, self.max_actions)
+        self.key_start = offset
+        self.action_start = offset + _aligned(key_bytes)
+
+    def __len__(self):
+        return self.num_entries
+
+    def __getitem__(self, player):
+        return PlayerPolicy(self, player)
+
+    def find(self, player, information):
+        """
+        entry of the information set, -1 if it is not stored
+        """
+        if self.table_size == 0:
+            return -1
+        key = encode_key(player, information)
+        h = hash_key(key)
+        mask = self.table_size - 1
+        slot = h & mask
+        while True:
+            entry = int(self.slot_entry[slot])
+            if entry < 0:
+                return -1
+            if int(self.slot_hash[slot]) == h:
+                start = self.key_start + int(self.key_offsets[entry])
+                end = self.key_start + int(self.key_offsets[entry + 1])
+                if self.buffer[start:end] == key:
+                    return entry
+            slot = (slot + 1) & mask
+
+    def _entry(self, player, information):
+        entry = self.find(player, information)
+        if entry < 0:
+            raise KeyError((player, information))
+        return entry
+
+    def probabilities(self, player, information):
+        """
+        read-only view of the action probabilities, in the order of actions()
+        """
+        entry = self._entry(player, information)
+        return self.probabilities_array[entry, :self.num_actions[entry]]
+
+    def entry_actions(self, entry):
+        start = self.action_start + int(self.action_offsets[entry])
+        end = self.action_start + int(self.action_offsets[entry + 1])
+        return tuple(self.buffer[start:end].decode().split("\0"))
+
+    def entry_p_dist(self, entry):
+        return dict(zip(self.entry_actions(entry), self.probabilities_array[entry, :self.num_actions[entry]].tolist()))
+
+    def actions(self, player, information):
+        return self.entry_actions(self._entry(player, information))
+
+    def p_dist(self, player, information):
+        return self.entry_p_dist(self._entry(player, information))
+
+    def close(self):
+        self.probabilities_array = self.slot_hash = self.slot_entry = None
+        self.key_offsets = self.action_offsets = self.num_actions = None
+        try:
+            self.buffer.close()
+        except BufferError:  # views returned by probabilities() are alive, the mapping is released with them
+            pass
+        self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
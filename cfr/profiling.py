@@ -0,0 +1,79 @@
+"""
+per-phase profiling of the training loop, reported through the logger with the other key-values
+
+    with profiling.phase("traverse"):
+        ...
+
+disabled (the default), phase() returns a shared no-op context manager and run_solver does not touch the profiler,
+so the cost is one function call per phase per iteration and nothing per node
+enabled (run_solver(..., profile=True)), every iteration is logged with logger.logkv_mean, so the rows dumped with the
+evaluations hold means per iteration over the iterations since the previous row:
+    time_<phase>       seconds spent in the phase (time_iteration: the whole loop body)
+    nodes_visited      solver.num_visited
+    infosets_updated   solver.num_updated
+    allocated_blocks   growth of sys.getallocatedblocks() over the iteration
+"""
+import sys
+import time
+from contextlib import contextmanager, nullcontext
+
+import logger
+
+PHASES = ("traverse", "update", "evict", "evaluate", "checkpoint")
+
+_enabled = False
+_times = {}  # phase -> seconds spent in it in the current iteration
+_null = nullcontext()
+
+
+def enable(enabled=True):
+    global _enabled
+    _enabled = enabled
+    _times.clear()
+
+
+def is_enabled():
+    return _enabled
+
+
+def phase(name):
+    if not _enabled:
+        return _null
+    return _timed(name)
+
+
+@contextmanager
+def _timed(name):
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        _times[name] = _times.get(name, 0.0) + time.perf_counter() - start
+
+
+class IterationProfiler:
+    """
+    begin() and end(solver) around every iteration of the training loop
+    """
+    def __init__(self):
+        self.phases = list(PHASES)
+        self.start = None
+        self.start_blocks = None
+
+    def begin(self):
+        _times.clear()
+        self.start_blocks = sys.getallocatedblocks()
+        self.start = time.perf_counter()
+
+    def end(self, solver):
+        elapsed = time.perf_counter() - self.start
+        blocks = sys.getallocatedblocks() - self.start_blocks
+        for name in _times:
+            if name not in self.phases:
+                self.phases.append(name)
+        logger.logkv_mean("time_iteration", elapsed)
+        for name in self.phases:
+            logger.logkv_mean("time_" + name, _times.get(name, 0.0))
+        logger.logkv_mean("nodes_visited", solver.num_visited)
+        logger.logkv_mean("infosets_updated", solver.num_updated)
+        logger.logkv_mean("allocated_blocks", blocks)
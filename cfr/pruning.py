@@ -0,0 +1,255 @@
+import numpy as np
+
+from envs.game import Node
+
+
+def set_subtree_sizes(root: Node):
+    """
+    node.subtree_size: number of nodes in the subtree rooted at node, used to count pruned nodes
+    """
+    nodes = [root]
+    for node in nodes:  # parents before children
+        nodes.extend(node.child_nodes)
+    for node in reversed(nodes):
+        node.subtree_size = 1 + sum(child.subtree_size for child in node.child_nodes)
+    return root.subtree_size
+
+
+class Pruning:
+    """
+    pruning of cfr.traverse_tree
+
+    zero_reach: skip the subtrees that no player reaches. Their nodes get neither regret (weighted by opponent reach)
+                nor average strategy (weighted by own reach) updates, so the result is exactly that of the full traversal.
+                With alternating updates, only the traverser's and its opponents' reach need to be zero.
+    regret_based: regret-based pruning (Brown & Sandholm, NIPS 2015) of two-player vanilla CFR with alternating updates.
+                  An action of the traverser that regret matching assigns zero probability is skipped as long as its
+                  cumulative regret stays at most 0 even if the next traversal adds the most it can (growth), so the
+                  action would have had zero probability without pruning too. A skipped action
+                  takes the highest value of its subtree (optimistic), so its regret grows by an upper bound of what
+                  the traversal would have added. When pruning ends, the regret is lowered to the upper bound given by
+                  a best response in the subtrees of the action against the opponent's average strategy (Brown &
+                  Sandholm, ICML 2017) if that is lower, which usually prunes it again for longer.
+    Pruned children are marked with node.pruned.
+    """
+    def __init__(self, zero_reach=True, regret_based=False):
+        self.zero_reach = zero_reach
+        self.regret_based = regret_based
+        self.prune_regrets = False  # regret based pruning is active in the current traversal
+        self.pruned_slots = None  # pruned_slots[infoset id][slot]: the action is skipped in the current traversal
+        self.optimistic = None  # node -> player 0's highest utility under it if its parent is player 0's, else the lowest
+        self.cfv_sum = None  # counterfactual value of every information set summed over its traversals
+        self.visited = None  # visited[infoset id]: the information set was reached by the current traversal
+        self.num_pruned = 0  # nodes skipped in the current iteration
+
+    def setup(self, root: Node, table):
+        """
+        bounds of regret based pruning on the tree under root, whose information sets are the rows of
+        table (infoset_table.InfosetTable), kept as arrays over its nodes in breadth first order
+        ranges[i, slot]: highest utility after the action - lowest utility of the i-th decision node, for its player.
+                         A traversal adds at most the sum of ranges weighted by the reach of chance and the opponent
+                         over the nodes of the information set to the regret of the action (growth).
+        loss[row, slot]: sum over the nodes of chance reach * the lowest (negative) utility after the action, the least
+                         a traversal adds to the counterfactual value of the action
+        """
+        if table.num_players != 2:
+            raise ValueError("regret based pruning requires two players")
+        n = table.num_infosets
+        nodes = [root]
+        parent_index, edge_row, edge_slot, edge_player = [-1], [0], [0], [-2]
+        self.levels = []  # (begin, end) of the nodes at every depth
+        begin = 0
+        while begin < len(nodes):
+            end = len(nodes)
+            self.levels.append((begin, end))
+            for index in range(begin, end):
+                node = nodes[index]
+                for slot, child_node in enumerate(node.child_nodes):
+                    nodes.append(child_node)
+                    parent_index.append(index)
+                    edge_row.append(node.info_id)
+                    edge_slot.append(slot)
+                    edge_player.append(node.player)
+            begin = end
+        self.parent_index = np.array(parent_index)
+        self.edge_row, self.edge_slot, edge_player = np.array(edge_row), np.array(edge_slot), np.array(edge_player)
+        # the edges of chance and the opponent of every player, and of chance
+        self.edges = {players: np.isin(edge_player, players) for players in [(-1, 1), (-1, 0), (-1,)]}
+
+        low, high = [0.0] * len(nodes), [0.0] * len(nodes)  # range of player 0's utility in the subtree of a node
+        index = {node: i for i, node in enumerate(nodes)}
+        for i in reversed(range(len(nodes))):
+            node = nodes[i]
+            if node.terminal:
+                low[i] = high[i] = node.eu
+            else:
+                low[i] = min(low[index[child_node]] for child_node in node.child_nodes)
+                high[i] = max(high[index[child_node]] for child_node in node.child_nodes)
+        chance_reach = self.reach(table.strategy, (-1,))
+        self.infoset_nodes = [[] for _ in range(n)]  # infoset id -> [(node, index)]
+        self.optimistic = {}
+        decision_index, decision_row, decision_player, ranges = [], [], [], []
+        # slots of the widest decision: chance rows are usually wider, but are never pruned
+        width = max((len(node.child_nodes) for node in nodes if not node.terminal and node.player != -1), default=0)
+        self.loss = np.zeros((n, width))
+        for i, node in enumerate(nodes):
+            if node.terminal or node.player == -1:
+                continue
+            self.infoset_nodes[node.info_id].append((node, i))
+            decision_index.append(i)
+            decision_row.append(node.info_id)
+            decision_player.append(node.player)
+            ranges.append([0.0] * len(node.child_nodes))
+            for slot, child_node in enumerate(node.child_nodes):
+                child = index[child_node]
+                if node.player == 0:
+                    self.optimistic[child_node] = high[child]
+                    ranges[-1][slot] = max(high[child] - low[i], 0.0)
+                    lowest = low[child]
+                else:
+                    self.optimistic[child_node] = low[child]
+                    ranges[-1][slot] = max(high[i] - low[child], 0.0)
+                    lowest = -high[child]
+                self.loss[node.info_id, slot] += chance_reach[i] * min(lowest, 0.0)
+        self.decision_index, self.decision_row = np.array(decision_index), np.array(decision_row)
+        self.decision_player = np.array(decision_player)
+        self.ranges = np.array([r + [0.0] * (width - len(r)) for r in ranges]).reshape(len(ranges), width)
+        self.valid = table.valid
+        self.pruned = np.zeros((n, width), dtype=bool)
+        self.visits = np.zeros(n, dtype=np.int64)  # traversals that reached the information set
+        self.num_traversals = np.zeros(table.num_players, dtype=np.int64)
+        self.cfv_sum = [0.0] * n
+        self.visited = [False] * n
+        self.pruned_slots = self.pruned.tolist()
+
+    def begin_iteration(self):
+        self.num_pruned = 0
+
+    def begin_traversal(self, traverser, table):
+        """
+        end the pruning of the traverser's actions whose regret could become positive in its next traversal (or that
+        regret matching gives a positive probability again, when all the regrets of their information set are at most
+        0) and catch up their regrets, then select the actions to prune in the traversal, with the current strategy
+        of table
+        """
+        self.prune_regrets = self.regret_based
+        if not self.regret_based:
+            return
+        rows = table.rows([traverser])
+        opponent = 1 - traverser
+        width = self.pruned.shape[1]
+        growth = self.growth(traverser, self.reach(table.strategy, (-1, opponent)))[rows]
+        regret = table.regret[rows, :width]
+        zero = self.valid[rows, :width] & (table.strategy[rows, :width] == 0)
+        ended = self.pruned[rows] & (~zero | (regret + growth > 0))
+        if ended.any():
+            average = table.average_strategy()
+            average_reach = self.reach(average, (-1, opponent))
+            average = average[:, :width].tolist()
+            for i, slot in zip(*np.nonzero(ended)):
+                row = rows[i]
+                bound = self.value_bound(row, slot, traverser, average, average_reach) - self.cfv_sum[row]
+                regret[i, slot] = min(regret[i, slot], bound)
+            table.regret[rows, :width] = regret
+        pruned = self.pruned[rows] = zero & (regret + growth <= 0)
+        for row, slots in zip(rows.tolist(), pruned.tolist()):
+            self.pruned_slots[row] = slots
+        self.num_traversals[traverser] += 1
+
+    def end_traversal(self):
+        if self.regret_based:
+            self.visits += np.array(self.visited, dtype=np.int64)
+            self.visited = [False] * len(self.visited)
+
+    def reach(self, strategy, players):
+        """
+        reach probability of every node by the actions of players ((-1,), (-1, 0) or (-1, 1)), following
+        strategy[infoset id, slot]
+        """
+        edge_p = np.where(self.edges[players], strategy[self.edge_row, self.edge_slot], 1.0)
+        reach = np.ones(len(edge_p))
+        for begin, end in self.levels[1:]:
+            reach[begin:end] = reach[self.parent_index[begin:end]] * edge_p[begin:end]
+        return reach
+
+    def growth(self, player, opponent_reach):
+        """
+        [infoset id, slot]: the most a traversal with opponent_reach (reach by chance and the opponent) adds to the
+        regrets of player
+        """
+        mine = self.decision_player == player
+        weighted = opponent_reach[self.decision_index[mine], None] * self.ranges[mine]
+        rows = self.decision_row[mine]
+        growth = np.zeros(self.pruned.shape)
+        for slot in range(weighted.shape[1]):
+            growth[:, slot] = np.bincount(rows, weighted[:, slot], len(growth))
+        return growth
+
+    def value_bound(self, row, slot, player, average, average_reach):
+        """
+        upper bound of the counterfactual value of the action slot of information set row summed over the traversals
+        that reached it: num_traversals of the opponent times the value of player's best response in the subtrees of
+        the action against the opponent's average strategy, over which the opponent's strategies of those traversals
+        are averaged, minus the lowest value of the traversals that did not reach the information set
+        average: table.average_strategy() as lists, over the slots of the decisions
+        average_reach: reach of the nodes by chance and the opponent's average strategy
+        """
+        opponent = 1 - player
+        sign = 1 if player == 0 else -1
+        level = [(node.child_nodes[slot], average_reach[index]) for node, index in self.infoset_nodes[row]]
+        levels = [level]
+        while level:  # the nodes of an information set of player are at the same depth
+            next_level = []
+            for node, reach in level:
+                for child_slot, child_node in enumerate(node.child_nodes):
+                    if node.player == -1:
+                        next_level.append((child_node, reach / len(node.child_nodes)))
+                    elif node.player == opponent:
+                        next_level.append((child_node, reach * average[node.info_id][child_slot]))
+                    else:
+                        next_level.append((child_node, reach))
+            levels.append(next_level)
+            level = next_level
+
+        value = {}
+        for level in reversed(levels):
+            action_values = {}
+            for node, reach in level:
+                if not node.terminal and node.player == player:
+                    values = action_values.setdefault(node.info_id, [0.0] * len(node.child_nodes))
+                    for child_slot, child_node in enumerate(node.child_nodes):
+                        values[child_slot] += reach * value[child_node]
+            best = {info_id: values.index(max(values)) for info_id, values in action_values.items()}
+            for node, _ in level:
+                if node.terminal:
+                    value[node] = sign * node.eu
+                elif node.player == -1:
+                    value[node] = sum(value[child_node] for child_node in node.child_nodes) / len(node.child_nodes)
+                elif node.player == opponent:
+                    p_dist = average[node.info_id]
+                    value[node] = sum(p_dist[child_slot] * value[child_node]
+                                      for child_slot, child_node in enumerate(node.child_nodes))
+                else:
+                    value[node] = value[node.child_nodes[best[node.info_id]]]
+        best_response_value = sum(reach * value[node] for node, reach in levels[0])
+        num_traversals = self.num_traversals[opponent]
+        return num_traversals * best_response_value - (num_traversals - self.visits[row]) * self.loss[row, slot]
+
+    def prune(self, node: Node):
+        node.pruned = True
+        self.num_pruned += node.subtree_size
+
+    def state_dict(self):
+        return {
+            "pruning_pruned": self.pruned,
+            "pruning_visits": self.visits,
+            "pruning_num_traversals": self.num_traversals,
+            "pruning_cfv_sum": np.array(self.cfv_sum),
+        }
+
+    def load_state_dict(self, state: dict):
+        self.pruned = state["pruning_pruned"].copy()
+        self.pruned_slots = self.pruned.tolist()
+        self.visits = state["pruning_visits"].copy()
+        self.num_traversals = state["pruning_num_traversals"].copy()
+        self.cfv_sum = state["pruning_cfv_sum"].tolist()
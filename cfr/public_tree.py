@@ -0,0 +1,167 @@
+"""
+vector-form CFR on the public tree: the nodes of every deal that share a public history are merged into one public node,
+and reach probabilities and counterfactual values are vectors over the private hands of each player
+(Zinkevich et al. 2007, Johanson et al. 2012)
+
+the root chance node must deal the private cards, and every other chance outcome must be public (part of the history),
+as in envs.toy_pokers.Poker. The chance probabilities and card removal are folded into the hand-vs-hand utility matrix of
+each terminal public node, so the traversal never iterates over deals.
+"""
+import numpy as np
+
+import profiling
+from envs.game import Node
+from infoset_table import InfosetTable, TableSolver
+from update_rules import get_update_rule
+
+
+class PublicTree:
+    """
+    public nodes are stored parents first
+    hands[player]: the private cards of player, which index the vectors of player
+    utility[i]: at terminal public node i, utility[i][h0, h1] is the sum of chance probability * player 0's utility of the
+                nodes where player 0 holds hands[0][h0] and player 1 holds hands[1][h1] (0 for impossible pairs)
+    info_ids[i][h]: infoset of the hand h at the player node i in the InfosetTable, -1 if the hand cannot be held there
+    num_deals[i][h]: number of nodes merged into player node i where the hand h is held, which weights its reach in the
+                     average strategy as in the node traversals (only matters when hands share an information set)
+    """
+    def __init__(self, root: Node, num_players: int, table=None):
+        if num_players != 2 or root.player != -1:
+            raise ValueError("the public tree needs a two-player game whose root deals the private cards")
+        self.num_players = num_players
+        self.table = InfosetTable.from_tree(root, num_players) if table is None else table.index_tree(root)
+        deals = root.child_nodes
+        self.hands = [sorted({deal.private_cards[player] for deal in deals}) for player in range(num_players)]
+        hand_index = [{hand: h for h, hand in enumerate(hands)} for hands in self.hands]
+
+        self.player, self.terminal, self.history, self.actions, self.children = [], [], [], [], []
+        self.utility, self.info_ids, self.num_deals = {}, {}, {}
+        index = {}  # public history -> public node
+        stack = [(deal, 1 / len(deals), tuple(hand_index[player][deal.private_cards[player]] for player in range(num_players)),
+                  -1, None) for deal in reversed(deals)]
+        while stack:
+            node, chance_p, hands, parent, edge = stack.pop()
+            key = tuple(node.history)
+            i = index.get(key)
+            if i is None:
+                i = index[key] = self._add_node(node)
+                if parent >= 0:
+                    if self.player[parent] == -1:
+                        self.children[parent].append(i)
+                    else:
+                        self.children[parent][edge] = i
+            if node.terminal:
+                self.utility[i][hands] += chance_p * node.eu
+                continue
+            if node.player != -1:
+                hand = node.private_cards[node.player]
+                self.info_ids[i][hand_index[node.player][hand]] = node.info_id
+                self.num_deals[i][hand_index[node.player][hand]] += 1
+            for slot, child_node in enumerate(reversed(node.child_nodes)):
+                slot = len(node.child_nodes) - 1 - slot
+                p = chance_p / len(node.child_nodes) if node.player == -1 else chance_p
+                stack.append((child_node, p, hands, i, slot))
+        self.num_nodes = len(self.player)
+        self.valid = {i: info_ids >= 0 for i, info_ids in self.info_ids.items()}
+
+    def _add_node(self, node: Node):
+        i = len(self.player)
+        self.player.append(node.player)
+        self.terminal.append(node.terminal)
+        self.history.append(tuple(node.history))
+        self.actions.append(tuple(node.children))
+        self.children.append([] if node.player == -1 else [-1] * len(node.child_nodes))
+        if node.terminal:
+            self.utility[i] = np.zeros([len(hands) for hands in self.hands])
+        elif node.player != -1:
+            self.info_ids[i] = np.full(len(self.hands[node.player]), -1, dtype=np.int64)
+            self.num_deals[i] = np.zeros(len(self.hands[node.player]))
+        return i
+
+
+class PublicTreeCFR(TableSolver):
+    """
+    CFR over a PublicTree, with the regrets and strategy sums of its InfosetTable
+    the reach vectors flow down and the counterfactual value vectors flow up the public nodes, so the Python-level work
+    is per public node and the work per hand is done by numpy
+    with alternating=True, each iteration updates the players one after another
+    """
+    def __init__(self, tree: PublicTree, update_rule=None, alternating=False):
+        self.tree = tree
+        self.table = tree.table
+        self.update_rule = get_update_rule(update_rule)
+        self.alternating = alternating
+        self.t = 0  # number of iterations done
+        self.num_visited = 0  # public nodes visited in the last iteration
+        self.num_updated = 0  # information sets updated in the last iteration
+
+    def iteration(self):
+        self.t += 1
+        groups = [[player] for player in range(self.tree.num_players)] if self.alternating else [None]
+        for players in groups:
+            with profiling.phase("traverse"):
+                self._traverse(range(self.tree.num_players) if players is None else players)
+            with profiling.phase("update"):
+                rows = self.table.rows(players)
+                self.table.discount(self.t, self.update_rule, rows)
+                self.table.regret_matching(rows)
+        self.num_visited = self.tree.num_nodes * len(groups)
+        self.num_updated = sum(len(self.table.rows(players)) for players in groups)
+
+    def _strategy(self, i):
+        """
+        (hands, actions) strategy at player node i, uniform for the hands that cannot be held there
+        """
+        tree = self.tree
+        num_actions = len(tree.actions[i])
+        strategy = np.full((len(tree.info_ids[i]), num_actions), 1 / num_actions)
+        valid = tree.valid[i]
+        strategy[valid] = self.table.strategy[tree.info_ids[i][valid], :num_actions]
+        return strategy
+
+    def _traverse(self, players):
+        """
+        accumulate the regrets of players and the average strategy of the current strategy
+        """
+        tree, table = self.tree, self.table
+        strategy = {}
+        reach = [None] * tree.num_nodes  # reach[i][player]: reach vector of player over its hands
+        reach[0] = [np.ones(len(hands)) for hands in tree.hands]
+        for i in range(tree.num_nodes):
+            if tree.terminal[i]:
+                continue
+            player = tree.player[i]
+            if player == -1:
+                for child in tree.children[i]:
+                    reach[child] = reach[i]
+                continue
+            strategy[i] = self._strategy(i)
+            for slot, child in enumerate(tree.children[i]):
+                reach[child] = list(reach[i])
+                reach[child][player] = reach[i][player] * strategy[i][:, slot]
+
+        reach_delta = np.zeros(table.num_infosets)
+        value = [None] * tree.num_nodes  # value[i][player]: counterfactual values of player 0's utility over the hands of player
+        for i in reversed(range(tree.num_nodes)):
+            if tree.terminal[i]:
+                utility = tree.utility[i]
+                value[i] = [utility @ reach[i][1], utility.T @ reach[i][0]]
+                continue
+            children = tree.children[i]
+            player = tree.player[i]
+            if player == -1:
+                value[i] = [sum(value[child][p] for child in children) for p in range(tree.num_players)]
+                continue
+            action_values = np.stack([value[child][player] for child in children], axis=1)  # (hands, actions)
+            node_value = (strategy[i] * action_values).sum(axis=1)
+            value[i] = [node_value if p == player else sum(value[child][p] for child in children)
+                        for p in range(tree.num_players)]
+            if player in players:
+                valid = tree.valid[i]
+                info_ids = tree.info_ids[i][valid]
+                sign = 1 if player == 0 else -1  # utilities are stored from player 0's point of view
+                # with a card abstraction, several hands share an information set
+                np.add.at(table.regret, (info_ids, slice(0, len(children))), sign * (action_values - node_value[:, None])[valid])
+                np.add.at(reach_delta, info_ids, (tree.num_deals[i] * reach[i][player])[valid])
+
+        table.add_reach(reach_delta)
@@ -0,0 +1,213 @@
+"""
+sampled estimate of the exploitability, whose cost does not depend on the size of the game tree
+Equilibrium Approximation Quality of Current No-Limit Poker Bots, V. Lisý, M. Bowling. AAAI 2017 (local best response)
+
+for each player, num_samples games are played where that player is a local best responder and the others follow
+strategy_profile. The responder keeps the distribution over the histories consistent with its information (its range,
+i.e. the opponent's private cards weighted by chance and the opponent's strategy), and at each of its decisions takes
+the action of the highest expected value under that distribution, the values being estimated by num_rollouts rollouts
+where every player follows strategy_profile.
+a local best response is a best response only up to the rollouts, so the estimate is a lower bound of the exploitability
+(up to sampling error), and the cost of a sample is (depth * histories in the range * actions * num_rollouts * depth).
+
+SampledBestResponse bounds it from the other side: the exact best response is computed on the game whose chance nodes
+only have the outcomes of num_trajectories sampled trajectories, each weighted by its frequency. The best response
+fits the sampled outcomes, so the estimate is an upper bound of the exploitability in expectation, which tightens as
+num_trajectories grows. A trajectory samples one outcome at every chance node and follows every action, so its cost is
+the size of the tree of the players' actions, whatever the number of chance outcomes.
+"""
+import math
+import random
+from statistics import NormalDist
+
+from best_response import compute_best_response, get_p_dist
+from envs.game import Node
+
+
+class Estimate:
+    """
+    mean of samples with the half width of its confidence interval (normal approximation)
+    float(estimate) is the mean, so it can stand for an exact exploitability
+    """
+    def __init__(self, value, half_width, num_samples):
+        self.value = value
+        self.half_width = half_width
+        self.num_samples = num_samples
+
+    def __float__(self):
+        return float(self.value)
+
+    def __repr__(self):
+        return "%.4g +- %.2g (%d samples)" % (self.value, self.half_width, self.num_samples)
+
+
+def view(node: Node, player):
+    """
+    what player knows at node: its private cards and the public history
+    """
+    return node.private_cards[player], tuple(node.history)
+
+
+def rollout(node: Node, strategy_profile: dict, rng):
+    """
+    player 0's utility at the end of a game played from node with strategy_profile
+    """
+    while not node.terminal:
+        if node.player == -1:
+            children = list(node.children.values())
+            node = children[rng.randrange(len(children))]
+            continue
+        p_dist = get_p_dist(strategy_profile, node)
+        actions = list(p_dist)
+        node = node.children[rng.choices(actions, [p_dist[action] for action in actions])[0]]
+    return node.eu
+
+
+def advance(histories, strategy_profile: dict, player, next_view):
+    """
+    histories: [(node, weight)] consistent with what player knows, weight being the probability of chance and the
+    other players playing to node
+    returns the histories of their children that player sees as next_view
+    """
+    next_histories = []
+    for node, weight in histories:
+        p_dist = None if node.player in (-1, player) else get_p_dist(strategy_profile, node)
+        for action, child in node.children.items():
+            if node.player == -1:
+                p = 1 / len(node.children)
+            else:
+                p = 1.0 if p_dist is None else p_dist[action]
+            if p > 0 and view(child, player) == next_view:
+                next_histories.append((child, weight * p))
+    return next_histories
+
+
+def local_best_response(game, strategy_profile: dict, player, num_rollouts=1, rng=None):
+    """
+    utility of player in one game where it plays a local best response, averaged over the histories it cannot tell
+    apart at the end of the game
+    """
+    rng = rng or random.Random()
+    sign = 1 if player == 0 else -1  # utilities are stored from player 0's point of view
+    node = game.root
+    histories = [(node, 1.0)]
+    while not node.terminal:
+        if node.player == player:
+            total = sum(weight for _, weight in histories)
+            values = {}
+            for action in node.children:
+                values[action] = sum(weight * rollout(history.children[action], strategy_profile, rng)
+                                     for history, weight in histories for _ in range(num_rollouts))
+                values[action] *= sign / (total * num_rollouts)
+            child = node.children[max(values, key=values.get)]
+        elif node.player == -1:
+            children = list(node.children.values())
+            child = children[rng.randrange(len(children))]
+        else:
+            p_dist = get_p_dist(strategy_profile, node)
+            actions = list(p_dist)
+            child = node.children[rng.choices(actions, [p_dist[action] for action in actions])[0]]
+        histories = advance(histories, strategy_profile, player, view(child, player))
+        node = child
+    # the expected utility over the range rather than the utility of the sampled history: same mean, less variance
+    return sign * sum(weight * history.eu for history, weight in histories) / sum(weight for _, weight in histories)
+
+
+class SampledExploitability:
+    """
+    evaluation of train (a function of game and strategy_profile) returning the Estimate of the sum over the players of
+    their local best response values, with its confidence interval
+    """
+    def __init__(self, num_samples=1000, num_rollouts=4, confidence=0.95, seed=None):
+        self.num_samples = num_samples
+        self.num_rollouts = num_rollouts
+        self.confidence = confidence
+        self.rng = random.Random(seed)
+
+    def __call__(self, game, strategy_profile: dict):
+        value, variance = 0.0, 0.0
+        for player in range(game.num_players):
+            samples = [local_best_response(game, strategy_profile, player, self.num_rollouts, self.rng)
+                       for _ in range(self.num_samples)]
+            mean = sum(samples) / len(samples)
+            value += mean
+            if len(samples) > 1:
+                variance += sum((x - mean) ** 2 for x in samples) / (len(samples) - 1) / len(samples)
+        z = NormalDist().inv_cdf((1 + self.confidence) / 2)
+        return Estimate(value, z * math.sqrt(variance), self.num_samples)
+
+
+def sample_trajectories(root: Node, num_trajectories, rng):
+    """
+    {node: fraction of the trajectories reaching it}, a trajectory following one uniformly sampled outcome at every
+    chance node and every action of the players
+    """
+    frequency = {}
+    for _ in range(num_trajectories):
+        stack = [root]
+        while stack:
+            node = stack.pop()
+            frequency[node] = frequency.get(node, 0.0) + 1 / num_trajectories
+            if node.terminal:
+                continue
+            if node.player == -1:
+                children = node.child_nodes
+                stack.append(children[rng.randrange(len(children))])
+            else:
+                stack.extend(node.child_nodes)
+    return frequency
+
+
+def sampled_best_responses(game, strategy_profile: dict, frequency: dict):
+    """
+    sum over the players of their best response values in the game of the sampled chance outcomes of frequency
+    """
+    root = game.root
+    levels = []
+    level = [root]
+    while level:
+        levels.append(level)
+        level = [child for node in level if not node.terminal for child in node.child_nodes if child in frequency]
+
+    def chance_p_dist(node):
+        return {action: frequency[child] / frequency[node] for action, child in node.children.items() if child in frequency}
+
+    value = 0.0
+    for player in range(game.num_players):
+        opponent_reach = {root: 1.0}
+        for level in levels:
+            for node in level:
+                if node.terminal:
+                    continue
+                p_dist = chance_p_dist(node) if node.player == -1 else get_p_dist(strategy_profile, node)
+                for action, child in node.children.items():
+                    if child in frequency:
+                        p = 1.0 if node.player == player else p_dist[action]
+                        opponent_reach[child] = opponent_reach[node] * p
+        value += compute_best_response(levels, strategy_profile, opponent_reach, player, chance_p_dist)[0]
+    return value
+
+
+class SampledBestResponse:
+    """
+    evaluation of train returning the Estimate of the exploitability by best responses on sampled chance outcomes
+    the num_trajectories are split into num_batches independent estimates, whose spread gives the confidence interval
+    (of the sampling error only: the upward bias shrinks with the size of the batches). On Leduc, with an exact
+    exploitability of 0.35, batches of 1000 trajectories estimate 0.54 and batches of 10000 estimate 0.36.
+    """
+    def __init__(self, num_trajectories=10000, num_batches=4, confidence=0.95, seed=None):
+        if num_batches < 2:
+            raise ValueError("the confidence interval needs at least 2 batches")
+        self.num_trajectories = num_trajectories
+        self.num_batches = num_batches
+        self.confidence = confidence
+        self.rng = random.Random(seed)
+
+    def __call__(self, game, strategy_profile: dict):
+        batch_size = max(self.num_trajectories // self.num_batches, 1)
+        samples = [sampled_best_responses(game, strategy_profile, sample_trajectories(game.root, batch_size, self.rng))
+                   for _ in range(self.num_batches)]
+        mean = sum(samples) / len(samples)
+        variance = sum((x - mean) ** 2 for x in samples) / (len(samples) - 1) / len(samples)
+        z = NormalDist().inv_cdf((1 + self.confidence) / 2)
+        return Estimate(mean, z * math.sqrt(variance), batch_size * self.num_batches)
@@ -0,0 +1,141 @@
+"""
+stop conditions of the training loop and its progress reporting
+
+a stop condition is called with the Progress of the run after every iteration and returns True to stop training
+they are cheap to call: the ones on the exploitability only look at the evaluations, which the evaluation schedule of
+train produces
+"""
+import sys
+import time
+
+
+class Progress:
+    """
+    state of a run of the training loop, seconds and nodes_visited count from the start of the run (not of a resumed
+    checkpoint)
+    """
+    def __init__(self, t=0):
+        self.t = t  # iterations done
+        self.start = time.perf_counter()
+        self.nodes_visited = 0
+        self.evaluations = []  # [(t, exploitability)] in order of t
+
+    @property
+    def seconds(self):
+        return time.perf_counter() - self.start
+
+    @property
+    def exploitability(self):
+        """
+        last evaluated exploitability, None before the first evaluation
+        """
+        return self.evaluations[-1][1] if self.evaluations else None
+
+
+class TargetExploitability:
+    """
+    stop when an evaluated exploitability is at most target
+    """
+    def __init__(self, target):
+        self.target = target
+
+    def __call__(self, progress):
+        return progress.exploitability is not None and progress.exploitability <= self.target
+
+    def __repr__(self):
+        return "TargetExploitability(%g)" % self.target
+
+
+class TimeBudget:
+    """
+    stop after `seconds` of wall time
+    """
+    def __init__(self, seconds):
+        self.seconds = seconds
+
+    def __call__(self, progress):
+        return progress.seconds >= self.seconds
+
+    def __repr__(self):
+        return "TimeBudget(%g)" % self.seconds
+
+
+class NodeBudget:
+    """
+    stop after num_nodes node visits (solver.num_visited of every iteration)
+    """
+    def __init__(self, num_nodes):
+        self.num_nodes = num_nodes
+
+    def __call__(self, progress):
+        return progress.nodes_visited >= self.num_nodes
+
+    def __repr__(self):
+        return "NodeBudget(%d)" % self.num_nodes
+
+
+class Plateau:
+    """
+    stop when the last `patience` evaluations did not bring the best exploitability min_improvement (relative) below
+    the best one before them
+    with a log-spaced evaluation schedule, patience evaluations cover a growing number of iterations
+    """
+    def __init__(self, patience=5, min_improvement=0.01):
+        self.patience = patience
+        self.min_improvement = min_improvement
+
+    def __call__(self, progress):
+        evaluations = progress.evaluations
+        if len(evaluations) <= self.patience:
+            return False
+        best_before = min(e for _, e in evaluations[:-self.patience])
+        best_recent = min(e for _, e in evaluations[-self.patience:])
+        return best_recent > best_before * (1 - self.min_improvement)
+
+    def __repr__(self):
+        return "Plateau(%d, %g)" % (self.patience, self.min_improvement)
+
+
+class ProgressReporter:
+    """
+    writes a progress line every `interval` seconds of wall time
+    the clock is only read every `stride` iterations, with stride adapted to the iteration rate so that it is read about
+    10 times per interval, so update() is a single comparison for most iterations
+    """
+    def __init__(self, num_iter, interval=10.0, file=None):
+        self.num_iter = num_iter
+        self.interval = interval
+        self.file = file
+        self.next_check = 0  # t at which the clock is read next
+        self.check_t, self.check_time = None, None
+        self.report_time = None
+
+    def update(self, progress):
+        if progress.t < self.next_check:
+            return
+        now = time.perf_counter()
+        if self.check_time is None:
+            self.report_time = now
+        else:
+            rate = (progress.t - self.check_t) / max(now - self.check_time, 1e-9)
+            self.next_check = progress.t + max(int(rate * self.interval / 10), 1)
+            if now - self.report_time >= self.interval:
+                self.report(progress, rate)
+                self.report_time = now
+        self.check_t, self.check_time = progress.t, now
+
+    def report(self, progress, rate=None, message=""):
+        seconds = progress.seconds
+        line = "t %d/%d (%.1f%%) %s elapsed" % (progress.t, self.num_iter, 100 * progress.t / max(self.num_iter, 1),
+                                                 _format_seconds(seconds))
+        if rate is not None:
+            line += ", %.1f it/s" % rate
+        if progress.exploitability is not None:
+            line += ", exploitability %.4g" % progress.exploitability
+        print(line + message, file=self.file or sys.stderr, flush=True)
+
+
+def _format_seconds(seconds):
+    minutes, seconds = divmod(int(seconds), 60)
+    hours, minutes = divmod(minutes, 60)
+    return "%d:%02d:%02d" % (hours, minutes, seconds)
@@ -0,0 +1,514 @@
+"""
+depth-limited re-solving of the subgame at a public state during play, within a time budget
+
+the subgame is made safe with the Resolve gadget (Solving Imperfect Information Games Using Decomposition, N. Burch,
+M. Johanson, M. Bowling. AAAI 2014): at its root, chance picks one of the information sets of the opponent of the
+player to act at the public state, and the opponent chooses between entering the subgame, where chance deals the
+histories of that information set, and taking the value its best response to the strategy played so far gets there.
+Chance follows the reach of chance and of the player to act, as the opponent may have left its blueprint before.
+below the root, the rules of the game are followed for max_depth decisions. At the nodes reached then (the leaves),
+the opponent chooses how the game continues among several continuation strategies, the blueprint and biased versions
+of it, while the player to act follows the blueprint (Depth-Limited Solving for Imperfect-Information Games,
+N. Brown, T. Sandholm, B. Amos. NeurIPS 2018), so that the re-solved strategy is not fitted to a single continuation.
+CFR iterations run on the subgame until the deadline. The re-solved strategy is kept only if no information set of the
+opponent at the root gets more from it than its alternative (Resolver.is_safe), in the model of the leaves above, and
+a later re-solve starts from the kept strategies rather than from the blueprint.
+
+    resolver = Resolver(game, blueprint)
+    p_dist = resolver.resolve(information, deadline_ms=50)
+
+the deadline covers the whole call: the belief ranges, the construction of the subgame and its leaf values count
+against it, and when it passes before min_iterations iterations are done the strategy played so far is returned. The
+leaf values are cached across calls, and Resolver(num_rollouts=...) bounds the cost of a new one.
+with an action abstraction, the public history has to be translated onto the abstract actions first
+(envs.abstraction.BetSizeAbstraction.translate).
+"""
+import random
+import time
+
+from best_response import compute_best_response, get_levels, get_opponent_reach
+from cfr import TreeCFR
+from envs.game import Game
+
+
+class DeadlineExceeded(Exception):
+    pass
+
+
+def check_deadline(deadline):
+    """
+    deadline: time.perf_counter() value, or None for no deadline
+    """
+    if deadline is not None and time.perf_counter() > deadline:
+        raise DeadlineExceeded
+
+
+def get_p_dist(blueprint: dict, player, information, actions):
+    """
+    information sets missing from blueprint are uniform, as in best_response.get_p_dist
+    """
+    p_dist = blueprint[player].get(information)
+    if p_dist is None:
+        p_dist = {action: 1 / len(actions) for action in actions}
+    return p_dist
+
+
+def belief_ranges(game: Game, history: tuple, blueprint: dict, deadline=None):
+    """
+    [(state, reach)] of the states where a player is to act after the public history, reach being the reach
+    probabilities [player 0, ..., chance] of state when every player follows blueprint
+    the states the blueprint of some player does not reach are kept, with a reach of 0 for it, as safe re-solving
+    lets the opponent deviate from its blueprint before the public state
+    raises DeadlineExceeded once deadline (time.perf_counter()) is passed
+    """
+    history = tuple(history)
+    ranges = []
+    stack = [(game.initial_state(), [1.0] * (game.num_players + 1))]
+    while stack:
+        check_deadline(deadline)
+        state, reach = stack.pop()
+        public_history = tuple(game.public_history(state))
+        if public_history != history[:len(public_history)] or game.is_terminal(state):
+            continue
+        player = game.current_player(state)
+        if public_history == history and player != -1:
+            ranges.append((state, reach))
+            continue
+        actions = game.actions(state)
+        p_dist = None if player == -1 else get_p_dist(blueprint, player, game.information(state, player), actions)
+        for action in actions:
+            next_reach = list(reach)
+            next_reach[player] *= 1 / len(actions) if player == -1 else p_dist[action]
+            stack.append((game.next_state(state, action), next_reach))
+    return ranges
+
+
+def action_kind(action):
+    """
+    "fold", "call" (check and call) or "raise" (bets and raises) for the actions of envs.toy_pokers.Poker
+    """
+    if action == "fold":
+        return "fold"
+    return "call" if action in ("check", "call") else "raise"
+
+
+class Bias:
+    """
+    continuation strategy of Brown, Sandholm & Amos: the blueprint with the probabilities of the actions of a kind
+    (action_kind) multiplied by factor, then normalized
+    """
+    def __init__(self, kind, factor=5.0):
+        self.kind = kind
+        self.factor = factor
+
+    def __call__(self, p_dist: dict):
+        weights = {action: p * self.factor if action_kind(action) == self.kind else p for action, p in p_dist.items()}
+        total = sum(weights.values())
+        return {action: weight / total for action, weight in weights.items()}
+
+    def __repr__(self):
+        return "Bias(%r, factor=%s)" % (self.kind, self.factor)
+
+
+CONTINUATIONS = (None, Bias("fold"), Bias("call"), Bias("raise"))
+
+
+class BlueprintValue:
+    """
+    leaf values: player 0's expected utility when every player follows blueprint from a state to the end of the game
+    the values are cached by state, so a Resolver reuses them across decisions
+    player, bias: the strategy of player is the blueprint changed by bias (e.g. Bias), a function of {action: p}
+    num_rollouts: estimate a value by the mean utility of num_rollouts games sampled from blueprint rather than by the
+                  exact expectation over the rest of the game, so that its cost is bounded by num_rollouts * depth
+    deadline: time.perf_counter() value after which computing a value raises DeadlineExceeded, set by Resolver. The
+              values finished before are kept.
+    """
+    def __init__(self, game: Game, blueprint: dict, num_rollouts=None, seed=None, player=None, bias=None):
+        self.game = game
+        self.blueprint = blueprint
+        self.num_rollouts = num_rollouts
+        self.rng = random.Random(seed)
+        self.player = player
+        self.bias = bias
+        self.deadline = None
+        self.values = {}
+
+    def __call__(self, state):
+        value = self.values.get(state)
+        if value is None:
+            if self.num_rollouts is None:
+                value = self._value(state)
+            else:
+                value = sum(self._rollout(state) for _ in range(self.num_rollouts)) / self.num_rollouts
+            self.values[state] = value
+        return value
+
+    def p_dist(self, state, player, actions):
+        p_dist = get_p_dist(self.blueprint, player, self.game.information(state, player), actions)
+        if player == self.player and self.bias is not None:
+            p_dist = self.bias(p_dist)
+        return p_dist
+
+    def _value(self, state):
+        check_deadline(self.deadline)
+        game = self.game
+        if game.is_terminal(state):
+            return game.terminal_utility(state)
+        player = game.current_player(state)
+        actions = game.actions(state)
+        if player == -1:
+            return sum(self(game.next_state(state, action)) for action in actions) / len(actions)
+        p_dist = self.p_dist(state, player, actions)
+        return sum(p_dist[action] * self(game.next_state(state, action)) for action in actions if p_dist[action] > 0)
+
+    def _rollout(self, state):
+        check_deadline(self.deadline)
+        game = self.game
+        while not game.is_terminal(state):
+            player = game.current_player(state)
+            actions = game.actions(state)
+            if player == -1:
+                action = actions[self.rng.randrange(len(actions))]
+            else:
+                p_dist = self.p_dist(state, player, actions)
+                action = self.rng.choices(actions, [p_dist[action] for action in actions])[0]
+            state = game.next_state(state, action)
+        return game.terminal_utility(state)
+
+
+class Subgame(Game):
+    """
+    game made of states, where player is to act, followed for max_depth decisions (None: to the end)
+    the root is None. States below it are tagged tuples:
+        ("gadget", j): the opponent chooses between "enter" and "alternative" at its j-th information set
+        ("alternative", j): terminal, alternatives[j] (player 0's utility)
+        ("deal", j): chance deals the states in the j-th information set of the opponent
+        ("play", state, decisions since the root)
+        ("leaf", state): the opponent chooses the continuation strategy of leaf_values to play from state
+        ("continuation", state, k): terminal, leaf_values[k](state)
+    without safe, the root deals the states directly. With a single leaf value, the leaves are terminal.
+    the information sets of the states of game keep their keys, so the strategy of the subgame can stand for the
+    blueprint's. The ones the subgame adds have the opponent's key with "gadget" or "continuation" appended to the
+    history.
+    the chance outcomes of the root and the deals are listed as equally likely, Resolver sets their probabilities
+    deadline: time.perf_counter() value after which building the tree raises DeadlineExceeded
+    """
+    def __init__(self, game: Game, states, player, max_depth=None, leaf_values=(), safe=True, deadline=None):
+        self.game = game
+        self.num_players = game.num_players
+        self.states = list(states)
+        self.player = player
+        self.opponent = 1 - player
+        self.max_depth = max_depth
+        self.leaf_values = list(leaf_values)
+        self.safe = safe
+        self.deadline = deadline
+        self.deals = {}  # opponent's information -> indices of its states
+        for i, state in enumerate(self.states):
+            self.deals.setdefault(game.information(state, self.opponent), []).append(i)
+        self.deals = list(self.deals.values())
+        self.alternatives = [0.0] * len(self.deals)
+        self.chance_p_dists = {}  # information of the root and the deals -> {outcome: p}, set by Resolver
+        super().__init__()
+
+    def initial_state(self):
+        return None
+
+    def current_player(self, state):
+        if state is None or state[0] == "deal":
+            return -1
+        if state[0] in ("gadget", "leaf"):
+            return self.opponent
+        return self.game.current_player(state[1])
+
+    def is_terminal(self, state):
+        if state is None:
+            return False
+        if state[0] in ("alternative", "continuation"):
+            return True
+        return state[0] == "play" and self.game.is_terminal(state[1])
+
+    def terminal_utility(self, state):
+        if state[0] == "alternative":
+            return self.alternatives[state[1]]
+        if state[0] == "continuation":
+            return self.leaf_values[state[2]](state[1])
+        return self.game.terminal_utility(state[1])
+
+    def chance_outcomes(self, state):
+        if state is None:
+            return [str(i) for i in range(len(self.deals) if self.safe else len(self.states))]
+        if state[0] == "deal":
+            return [str(i) for i in self.deals[state[1]]]
+        return self.game.chance_outcomes(state[1])
+
+    def legal_actions(self, state):
+        if state[0] == "gadget":
+            return ["enter", "alternative"]
+        if state[0] == "leaf":
+            return [str(k) for k in range(len(self.leaf_values))]
+        return self.game.legal_actions(state[1])
+
+    def actions(self, state):
+        if state is None or state[0] in ("deal", "gadget", "leaf"):
+            return self.chance_outcomes(state) if self.current_player(state) == -1 else self.legal_actions(state)
+        return self.game.actions(state[1])
+
+    def next_state(self, state, action):
+        check_deadline(self.deadline)
+        if state is None:
+            return ("gadget", int(action)) if self.safe else self._play(self.states[int(action)], 0)
+        if state[0] == "gadget":
+            return ("deal" if action == "enter" else "alternative", state[1])
+        if state[0] == "deal":
+            return self._play(self.states[int(action)], 0)
+        if state[0] == "leaf":
+            return "continuation", state[1], int(action)
+        _, state, depth = state
+        decision = self.game.current_player(state) != -1
+        return self._play(self.game.next_state(state, action), depth + 1 if decision else depth)
+
+    def _play(self, state, depth):
+        game = self.game
+        if (self.max_depth is not None and depth >= self.max_depth and not game.is_terminal(state)
+                and game.current_player(state) != -1):
+            return ("leaf", state) if len(self.leaf_values) > 1 else ("continuation", state, 0)
+        return "play", state, depth
+
+    def _state(self, state):
+        """
+        a state of game standing for state, for its cards and public history
+        """
+        if state is None:
+            return None
+        if state[0] in ("gadget", "alternative", "deal"):
+            return self.states[self.deals[state[1]][0]]
+        return state[1]
+
+    def private_cards(self, state):
+        if state is None:
+            return [() for _ in range(self.num_players + 1)]
+        return self.game.private_cards(self._state(state))
+
+    def public_history(self, state):
+        if state is None:
+            return ()
+        return self.game.public_history(self._state(state))
+
+    def information(self, state, player):
+        if state is None:
+            return (), ("root",)
+        if state[0] in ("gadget", "leaf"):
+            private, history = self.game.information(self._state(state), player)
+            return private, history + ("gadget" if state[0] == "gadget" else "continuation",)
+        if state[0] in ("alternative", "deal"):
+            return (), (state[0], state[1])
+        return self.game.information(state[1], player)
+
+
+class Resolver:
+    """
+    re-solves the subgame of each decision from blueprint, the average strategy profile of a trained solver on game
+    max_depth: decisions of the subgame below its root before the leaves, None to solve to the end of the game
+    continuations: the continuation strategies the opponent chooses from at the leaves, as biases of BlueprintValue
+                   (None for the blueprint itself)
+    num_rollouts: estimate the leaf values by sampling (BlueprintValue)
+    safe: add the Resolve gadget at the root and keep the re-solved strategy only if is_safe. Without it, the root
+          deals the states with the belief ranges of both players and the re-solved strategy is fitted to the opponent
+          following the blueprint before the subgame (unsafe re-solving), which can make it far more exploitable than
+          the blueprint.
+    update_rule: UpdateRule of the CFR iterations on the subgame (update_rules.UPDATE_RULES), CFR+ by default as it
+                 converges the fastest in the few iterations a deadline allows
+    min_iterations: below this number of iterations, the re-solved strategy is dropped
+    max_iterations: stop iterating there even if the deadline allows more
+    strategy: the profile played, the blueprint with the strategies of the player to act in the subgames re-solved so
+              far. A re-solve starts from it: the belief ranges, the current strategy of the subgame and the values of
+              the gadget follow it, so that a re-solve is safe with respect to the earlier ones it is nested in rather
+              than to the blueprint they departed from (Safe and Nested Subgame Solving for Imperfect-Information
+              Games, N. Brown, T. Sandholm. NIPS 2017). Build a new Resolver to start over from the blueprint.
+    after resolve, num_iterations, num_nodes and seconds describe the last re-solve (num_iterations is 0 when the
+    deadline passed while building the subgame or the public history had been re-solved before)
+    a resolve allocates the nodes of its subgame, so the garbage collector can run a full collection during it, which
+    takes time in proportion to all the objects of the process. A caller with tight deadlines can move the blueprint
+    and the other long-lived objects out of the collections with gc.freeze() once they are loaded.
+    """
+    def __init__(self, game: Game, blueprint: dict, max_depth=2, continuations=CONTINUATIONS, num_rollouts=None,
+                 safe=True, update_rule="cfr+", min_iterations=10, max_iterations=None):
+        if max_depth is not None and max_depth < 1:
+            raise ValueError("max_depth must be at least 1")
+        self.game = game
+        self.blueprint = blueprint
+        self.max_depth = max_depth
+        self.continuations = list(continuations)
+        self.num_rollouts = num_rollouts
+        self.safe = safe
+        self.update_rule = update_rule
+        self.min_iterations = min_iterations
+        self.max_iterations = max_iterations
+        self.strategy = {player: dict(p_dists) for player, p_dists in blueprint.items()}
+        self.solved = set()  # (player, public history) of the re-solved decisions
+        self._leaf_values = {}  # opponent -> [BlueprintValue of every continuation]
+        self.seconds_per_node = 0.0  # of the slowest iteration so far, to predict the time of the next one
+        self.num_iterations = 0
+        self.num_nodes = 0
+        self.seconds = 0.0
+
+    def leaf_values(self, opponent):
+        if opponent not in self._leaf_values:
+            self._leaf_values[opponent] = [BlueprintValue(self.game, self.blueprint, self.num_rollouts, seed=k,
+                                                          player=opponent, bias=bias)
+                                           for k, bias in enumerate(self.continuations)]
+        return self._leaf_values[opponent]
+
+    def build(self, history, ranges=None, deadline=None):
+        """
+        TreeCFR on the subgame after the public history, whose states are those of ranges (belief_ranges from strategy
+        by default), with strategy as its current strategy
+        raises DeadlineExceeded once deadline (time.perf_counter()) is passed
+        """
+        ranges = belief_ranges(self.game, history, self.strategy, deadline) if ranges is None else ranges
+        if not ranges:
+            raise ValueError("no state is reached after %s" % (tuple(history),))
+        player = self.game.current_player(ranges[0][0])
+        weighted = []
+        for state, reach in ranges:
+            weight = reach[-1]
+            for reach_player, p in enumerate(reach[:-1]):
+                if not (self.safe and reach_player == 1 - player):  # the gadget lets the opponent reach any state
+                    weight *= p
+            if weight > 0:
+                weighted.append((state, weight))
+        if not weighted:
+            raise ValueError("the blueprint of player %d does not reach %s" % (player, tuple(history)))
+        states, weights = [state for state, _ in weighted], [weight for _, weight in weighted]
+        leaf_values = self.leaf_values(1 - player)
+        for leaf_value in leaf_values:
+            leaf_value.deadline = deadline
+        try:
+            subgame = Subgame(self.game, states, player, self.max_depth, leaf_values, self.safe, deadline)
+        finally:
+            for leaf_value in leaf_values:
+                leaf_value.deadline = None
+        subgame.deadline = None
+        solver = TreeCFR(subgame, self.update_rule)
+        table = solver.table
+        for row, ((row_player, information), actions) in enumerate(zip(table.keys, table.actions)):
+            p_dist = self.strategy[row_player].get(information) if row_player != -1 else None
+            if p_dist is not None:
+                table.strategy[row, :len(actions)] = [p_dist[action] for action in actions]
+        chance = {}  # information of the root and the deals -> [p of every outcome]
+        root = subgame.root
+        if self.safe:
+            chance[root.information] = self._normalize([sum(weights[i] for i in deal) for deal in subgame.deals])
+            for gadget in root.child_nodes:
+                deal = gadget.children["enter"]
+                chance[deal.information] = self._normalize([weights[int(i)] for i in deal.children])
+        else:
+            chance[root.information] = self._normalize(weights)
+        for information, p in chance.items():
+            row = table.index[(-1, information)]
+            table.strategy[row, :len(p)] = p
+            subgame.chance_p_dists[information] = dict(zip(table.actions[row], p))
+        table.strategy_rows = table.strategy[:table.num_infosets].tolist()
+        if self.safe:
+            self._set_alternatives(subgame, player, deadline)
+        return solver
+
+    @staticmethod
+    def _normalize(weights):
+        total = sum(weights)
+        return [weight / total for weight in weights]
+
+    def _set_alternatives(self, subgame: Subgame, player, deadline):
+        """
+        value of the opponent's best response to the strategy played after entering at each of its information sets,
+        conditioned on entering there
+        """
+        alternatives = self.entry_values(subgame, player, self.strategy[player], deadline)
+        for gadget, alternative in zip(subgame.root.child_nodes, alternatives):
+            gadget.children["alternative"].eu = alternative
+        subgame.alternatives = alternatives
+
+    @staticmethod
+    def entry_values(subgame: Subgame, player, p_dists: dict, deadline=None):
+        """
+        [player 0's utility of the opponent's best response to the strategy p_dists of player after entering at the
+        j-th information set of the opponent, conditioned on entering there]
+        """
+        opponent = 1 - player
+        profile = {-1: subgame.chance_p_dists, player: p_dists, opponent: {}}
+        values = []
+        for gadget in subgame.root.child_nodes:
+            check_deadline(deadline)
+            levels = get_levels(gadget.children["enter"])
+            opponent_reach = get_opponent_reach(levels, profile, subgame.num_players)[opponent]
+            value, _ = compute_best_response(levels, profile, opponent_reach, opponent)
+            values.append(value if opponent == 0 else -value)
+        return values
+
+    def is_safe(self, subgame: Subgame, p_dists: dict):
+        """
+        the re-solved strategy p_dists of the player to act gives none of the opponent's information sets at the root
+        more than its alternative, the value of the strategy played. Without the gadget, every strategy passes.
+        """
+        if not self.safe:
+            return True
+        sign = 1 if subgame.opponent == 0 else -1
+        values = self.entry_values(subgame, subgame.player, p_dists)
+        return all(sign * value <= sign * alternative + 1e-9 for value, alternative in zip(values, subgame.alternatives))
+
+    def played_p_dist(self, information, player=None):
+        """
+        (player, {action: p}) of information in strategy, the blueprint refined by the earlier re-solves
+        """
+        players = range(self.game.num_players) if player is None else [player]
+        for player in players:
+            p_dist = self.strategy[player].get(information)
+            if p_dist is not None:
+                return player, dict(p_dist)
+        raise ValueError("%s is not in the blueprint and could not be re-solved in time" % (information,))
+
+    def resolve(self, information, deadline_ms, player=None, ranges=None):
+        """
+        refined {action: p} of the information set (private cards, public history) to act in
+        the subgame is built and CFR iterations run until the next one would end after deadline_ms milliseconds from
+        the call, the time of an iteration being predicted from the slowest one so far. When fewer than min_iterations
+        fit, the strategy played so far (the blueprint's or an earlier re-solve's) is kept.
+        the public history is only re-solved once, later calls for it return the strategy it was given
+        player: the player to act, found from ranges when not given
+        """
+        start = time.perf_counter()
+        deadline = start + deadline_ms / 1000
+        self.num_iterations = self.num_nodes = 0
+        history = tuple(information[1])
+        for solved_player in range(self.game.num_players) if player is None else [player]:
+            if (solved_player, history) in self.solved:
+                self.seconds = time.perf_counter() - start
+                return self.played_p_dist(information, solved_player)[1]
+        try:
+            solver = self.build(history, ranges, deadline)
+        except DeadlineExceeded:
+            player, p_dist = self.played_p_dist(information, player)
+            self.solved.add((player, history))
+            self.seconds = time.perf_counter() - start
+            return p_dist
+        player = solver.game.player
+        self.num_nodes = solver.game.num_nodes
+        iteration_seconds = self.seconds_per_node * self.num_nodes
+        reserve = 2 if self.safe else 1  # the check of is_safe takes about one iteration
+        while time.perf_counter() + reserve * iteration_seconds <= deadline and solver.t != self.max_iterations:
+            begin = time.perf_counter()
+            solver.iteration()
+            iteration_seconds = max(iteration_seconds, time.perf_counter() - begin)
+        self.seconds_per_node = max(self.seconds_per_node, iteration_seconds / self.num_nodes)
+        self.num_iterations = solver.t
+        self.solved.add((player, history))
+        average = solver.average_strategy_profile()[player]
+        if self.num_iterations >= self.min_iterations and self.is_safe(solver.game, average):
+            for key in solver.game.information_sets[player]:  # the information sets of game within max_depth
+                self.strategy[player][key] = average[key]
+        self.seconds = time.perf_counter() - start
+        p_dist = self.strategy[player].get(information)
+        if p_dist is None:  # not reached by the strategy played
+            p_dist = get_p_dist(self.strategy, player, information, self.game.actions(solver.game.states[0]))
+        return dict(p_dist)
@@ -0,0 +1,88 @@
+"""
+update rules applied to the cumulative regrets and average strategy sums after every iteration t (t starts from 1)
+
+- CFR+: Solving Large Imperfect Information Games Using CFR+, O. Tammelin 2014
+- Linear CFR / DCFR: Solving Imperfect-Information Games via Discounted Regret Minimization, N. Brown, T. Sandholm 2019
+"""
+
+
+class UpdateRule:
+    """
+    vanilla CFR: regret matching on the cumulative regrets, uniformly weighted average strategy
+    """
+    floor_regrets = False  # clip cumulative regrets at 0 after every iteration
+
+    def regret_discounts(self, t):
+        """
+        (multiplier of positive cumulative regrets, multiplier of negative cumulative regrets) after iteration t
+        """
+        return 1.0, 1.0
+
+    def average_discount(self, t):
+        """
+        multiplier of the average strategy numerator and denominator after iteration t
+        """
+        return 1.0
+
+    def __repr__(self):
+        return self.__class__.__name__ + "()"
+
+
+class CFRPlus(UpdateRule):
+    """
+    regrets are floored at 0 and iteration t is weighted by t in the average strategy
+    """
+    floor_regrets = True
+
+    def average_discount(self, t):
+        return t / (t + 1)
+
+
+class LinearCFR(UpdateRule):
+    """
+    iteration t is weighted by t in both the regrets and the average strategy
+    """
+    def regret_discounts(self, t):
+        return t / (t + 1), t / (t + 1)
+
+    def average_discount(self, t):
+        return t / (t + 1)
+
+
+class DiscountedCFR(UpdateRule):
+    """
+    DCFR(alpha, beta, gamma): positive regrets are discounted by t^alpha / (t^alpha + 1), negative regrets by
+    t^beta / (t^beta + 1) and the average strategy by (t / (t + 1))^gamma
+    """
+    def __init__(self, alpha=1.5, beta=0.0, gamma=2.0):
+        self.alpha = alpha
+        self.beta = beta
+        self.gamma = gamma
+
+    def regret_discounts(self, t):
+        return t ** self.alpha / (t ** self.alpha + 1), t ** self.beta / (t ** self.beta + 1)
+
+    def average_discount(self, t):
+        return (t / (t + 1)) ** self.gamma
+
+    def __repr__(self):
+        return "DiscountedCFR(alpha=%s, beta=%s, gamma=%s)" % (self.alpha, self.beta, self.gamma)
+
+
+UPDATE_RULES = {
+    "vanilla": UpdateRule,
+    "cfr+": CFRPlus,
+    "linear": LinearCFR,
+    "dcfr": DiscountedCFR,
+}
+
+
+def get_update_rule(update_rule):
+    """
+    accepts an UpdateRule or one of the names in UPDATE_RULES
+    """
+    if update_rule is None:
+        return UpdateRule()
+    if isinstance(update_rule, str):
+        return UPDATE_RULES[update_rule]()
+    return update_rule